@@ -0,0 +1,251 @@
+#-------------------------------------------------------------------------------
+# Name:        benchmark.py
+# Purpose:     Repeatable timing, memory and accuracy benchmark of orthogonality.py
+#
+# Author:      Adebayo .Y. Ishola
+#
+# Created:     October 2026
+#
+# Note:        Buildings are synthetic, so ground truth is known exactly.
+#              Results are written as JSON to compare between releases.
+#-------------------------------------------------------------------------------
+
+'''
+ Usage:       python benchmark.py --sizes 1000 10000 100000 1000000 --output benchmark.json
+
+ Regression:  python benchmark.py --baseline previous.json --threshold 1.25
+'''
+
+
+
+#packages
+
+from __future__ import print_function, division
+
+import os, sys, json, time, shutil, platform, tempfile, argparse, multiprocessing, numpy as np
+
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:                                                                                                     # Python 2.7 has no tracemalloc, peak memory is then not reported
+    tracemalloc = None
+
+import orthogonality
+
+#============ synthetic footprints
+
+# unit outlines of the building shapes, counter-clockwise in the building frame
+def _templates_(shape, count, rng):                                                                                     # function to build the (N, k, 2) ideal outline of every building
+    if shape == "rectangle":
+        unit = np.array([[0., 0.], [1., 0.], [1., 1.], [0., 1.]])
+        return np.repeat(unit[None], count, axis=0)
+    if shape == "lshape":
+        a, b = rng.uniform(0.3, 0.7, (2, count))                                                                        # position of the inner corner
+        zero, one = np.zeros(count), np.ones(count)
+        xs = np.stack([zero, one, one, b, b, zero], axis=1)
+        ys = np.stack([zero, zero, a, a, one, one], axis=1)
+        return np.stack([xs, ys], axis=2)
+    raise ValueError("unknown shape: %s" % shape)
+
+# intersect every edge line with the line of the previous edge
+def _intersect_(mid, direction):                                                                                        # function to rebuild the vertices of rings whose edges were rotated
+    prev_mid, prev_direction = np.roll(mid, 1, axis=1), np.roll(direction, 1, axis=1)
+    delta = mid - prev_mid
+    cross = prev_direction[..., 0] * direction[..., 1] - prev_direction[..., 1] * direction[..., 0]
+    t = (delta[..., 0] * direction[..., 1] - delta[..., 1] * direction[..., 0]) / cross
+    return prev_mid + t[..., None] * prev_direction
+
+# perturbed buildings with known ideal outline and orientation
+def syntheticFootprints(count, shape="rectangle", angleNoise=2., densify=2, jitter=0.05, seed=0, spacing=60.):          # function to generate buildings with controlled angle noise
+    """Return (footprints, truth) flat buffers of `count` buildings."""
+    rng = np.random.RandomState(seed)
+    outline = _templates_(shape, count, rng)
+    k = outline.shape[1]
+
+    size = rng.uniform(8., 30., (count, 1, 2))
+    theta = rng.uniform(0., np.pi / 2., count)
+    side = int(np.ceil(np.sqrt(count)))
+    centre = np.stack([np.arange(count) % side, np.arange(count) // side], axis=1) * spacing + [300000., 5600000.]
+    cos, sin = np.cos(theta)[:, None], np.sin(theta)[:, None]
+
+    local = (outline - 0.5) * size
+    ideal = np.stack([local[..., 0] * cos - local[..., 1] * sin, local[..., 0] * sin + local[..., 1] * cos], axis=2) + centre[:, None]
+
+    following = np.roll(ideal, -1, axis=1)
+    mid = (ideal + following) / 2.
+    azimuth = np.arctan2(following[..., 1] - ideal[..., 1], following[..., 0] - ideal[..., 0])
+    azimuth = azimuth + np.radians(rng.normal(0., angleNoise, (count, k)))
+    noisy = _intersect_(mid, np.stack([np.cos(azimuth), np.sin(azimuth)], axis=2))
+
+    if densify:
+        edge = np.roll(noisy, -1, axis=1) - noisy
+        normal = np.stack([-edge[..., 1], edge[..., 0]], axis=2) / np.hypot(edge[..., 0], edge[..., 1])[..., None]
+        fraction = np.arange(1, densify + 1) / (densify + 1.)
+        inner = noisy[:, :, None] + fraction[None, None, :, None] * edge[:, :, None]
+        inner += normal[:, :, None] * rng.uniform(-jitter, jitter, (count, k, densify, 1))
+        noisy = np.concatenate([noisy[:, :, None], inner], axis=2).reshape(count, -1, 2)
+
+    footprints = dict()
+    footprints['xy'] = noisy.reshape(-1, 2)
+    footprints['offsets'] = np.arange(count + 1, dtype=np.int64) * noisy.shape[1]
+    footprints['ids'] = np.arange(count, dtype=np.int64)
+
+    truth = dict()
+    truth['xy'] = ideal.reshape(-1, 2)
+    truth['offsets'] = np.arange(count + 1, dtype=np.int64) * k
+    truth['ids'] = footprints['ids']
+    truth['orientation'] = theta
+    return footprints, truth
+
+#============ measures
+
+# residual corner error of regularized buildings against the ideal outlines
+def cornerError(fixed, truth):                                                                                          # function to measure the distance of every output vertex to the nearest true corner
+    counts = np.diff(fixed['offsets'])
+    report = dict(buildings=int(len(counts)), mean=None, p95=None, max=None, vertex_match=None)
+    if len(counts) == 0:
+        return report
+
+    starts, sizes = truth['offsets'][fixed['ids']], np.diff(truth['offsets'])[fixed['ids']]
+    owner = np.repeat(np.arange(len(counts)), counts)                                                                   # building of every output vertex
+    pairs = sizes[owner]
+    vertex = np.repeat(np.arange(len(owner)), pairs)
+    target = orthogonality._ranges_(starts[owner], pairs)
+    distance = np.hypot(*(fixed['xy'][vertex] - truth['xy'][target]).T)
+    nearest = np.minimum.reduceat(distance, np.concatenate(([0], np.cumsum(pairs)[:-1])))
+
+    report['mean'] = float(nearest.mean())
+    report['p95'] = float(np.percentile(nearest, 95))
+    report['max'] = float(nearest.max())
+    report['vertex_match'] = float(np.mean(counts == sizes))                                                            # share of buildings rebuilt with the true vertex count
+    return report
+
+# best wall-clock time of a few runs
+def _timed_(function, repeat):                                                                                          # function to time a stage, returning the best time and the last result
+    best, value = None, None
+    for _ in range(repeat):
+        start = default_timer()
+        value = function()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+# peak Python/NumPy allocation of one extra, separate run
+def _peak_(function):                                                                                                   # function to measure peak memory without slowing down the timed runs
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+#============ benchmark runs
+
+# time every stage of the in-memory pipeline on one synthetic dataset
+def benchmarkCase(count, shape="rectangle", angleNoise=2., densify=2, tolerance=1., epsilon=15., orientation="histogram", repeat=3, memory=True, seed=0, workspace=None): # function to benchmark one dataset size and shape
+    footprints, truth = syntheticFootprints(count, shape, angleNoise, densify, seed=seed)
+    inFC = os.path.join(workspace, "%s_%d.shp" % (shape, count))
+    outFC = os.path.join(workspace, "%s_%d_fixed.shp" % (shape, count))
+    orthogonality.writeShapefile(inFC, footprints)                                                                      # untimed, the read stage starts from this file
+
+    stages = []
+
+    def stage(name, function):
+        seconds, value = _timed_(function, repeat)
+        record = dict(stage=name, seconds=seconds, buildings_per_second=count / seconds if seconds else None)
+        record['peak_bytes'] = _peak_(function) if memory else None
+        stages.append(record)
+        return value
+
+    data = stage('read', lambda: orthogonality.readShapefile(inFC, attributes=False))
+    simplified = stage('simplify', lambda: orthogonality.simplifyRings(data, tolerance))
+    stage('angles', lambda: orthogonality.ringAngles(simplified))
+    stage('lengths', lambda: orthogonality.ringLengths(orthogonality.ringSegments(simplified)))
+    summary = stage('summary', lambda: orthogonality.edgeSummary(simplified))
+    status = stage('classify', lambda: orthogonality.classifyBuildings(summary['angles'], summary['offsets'], epsilon))
+    fixable = orthogonality._subset_(summary, rings=status == orthogonality.FIXABLE)
+    fixed = stage('regularize', lambda: orthogonality.regularizeBuildings(fixable, epsilon, orientation))
+    stage('write', lambda: orthogonality.writeShapefile(outFC, fixed))
+    result = stage('pipeline', lambda: orthogonality.inMemoryPipeline(inFC, outFC, tolerance=tolerance, epsilon=epsilon, orientation=orientation))
+
+    case = dict(buildings=count, shape=shape, vertices=int(len(footprints['xy'])), angle_noise=angleNoise, densify=densify)
+    case['classes'] = dict(zip(('orthogonal', 'fixable', 'out_of_tolerance'), np.bincount(result['status'], minlength=3).tolist()))
+    case['accuracy'] = cornerError(result['fixed'], truth)
+    case['stages'] = stages
+    return case
+
+# run every size and shape, then gather the environment next to the results
+def runBenchmark(sizes=(1000, 10000, 100000, 1000000), shapes=("rectangle", "lshape"), angleNoise=2., densify=2, tolerance=1., epsilon=15., orientation="histogram", repeat=3, memory=True, seed=0): # function to produce the machine-readable benchmark report
+    workspace = tempfile.mkdtemp(prefix="orthogonality_benchmark_")
+    cases = []
+    try:
+        for shape in shapes:
+            for count in sizes:
+                case = benchmarkCase(count, shape, angleNoise, densify, tolerance, epsilon, orientation, repeat, memory, seed, workspace)
+                cases.append(case)
+                printCase(case)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    report = dict(created=time.strftime("%Y-%m-%dT%H:%M:%S"), cases=cases)
+    report['environment'] = dict(python=platform.python_version(), numpy=np.__version__, platform=platform.platform(), processor=platform.processor(), cpus=multiprocessing.cpu_count())
+    report['parameters'] = dict(tolerance=tolerance, epsilon=epsilon, orientation=orientation, repeat=repeat, seed=seed, angle_noise=angleNoise, densify=densify)
+    return report
+
+# stages that got slower than threshold times the baseline
+def compareBenchmarks(baseline, current, threshold=1.25):                                                               # function to flag regressions between two benchmark reports
+    before = dict(((case['shape'], case['buildings'], record['stage']), record['seconds']) for case in baseline['cases'] for record in case['stages'])
+    regressions = []
+    for case in current['cases']:
+        for record in case['stages']:
+            old = before.get((case['shape'], case['buildings'], record['stage']))
+            if old and record['seconds'] > old * threshold:
+                regressions.append(dict(shape=case['shape'], buildings=case['buildings'], stage=record['stage'], baseline=old, seconds=record['seconds'], ratio=record['seconds'] / old))
+    return regressions
+
+# one console line per stage
+def printCase(case):                                                                                                    # function to show the results of one case while the benchmark runs
+    accuracy = case['accuracy']
+    print("\n%s x %d (%d vertices)" % (case['shape'], case['buildings'], case['vertices']))
+    for record in case['stages']:
+        peak = "%8.1f MB" % (record['peak_bytes'] / 1e6) if record['peak_bytes'] is not None else "       n/a"
+        print("  %-10s %10.4f s %14.0f buildings/s %s" % (record['stage'], record['seconds'], record['buildings_per_second'] or 0, peak))
+    if accuracy['mean'] is not None:
+        print("  corner error: mean %.3f m, p95 %.3f m, max %.3f m, vertex match %.1f %%" % (accuracy['mean'], accuracy['p95'], accuracy['max'], 100 * accuracy['vertex_match']))
+
+# command line entry point
+def main(argv=None):                                                                                                    # function to parse the options, run the benchmark and write the JSON report
+    parser = argparse.ArgumentParser(description="Benchmark the building regularization stages on synthetic footprints.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="numbers of buildings")
+    parser.add_argument("--shapes", nargs="+", default=["rectangle", "lshape"], choices=["rectangle", "lshape"])
+    parser.add_argument("--angle-noise", type=float, default=2., help="standard deviation of the edge direction error, degrees")
+    parser.add_argument("--densify", type=int, default=2, help="extra vertices per edge for the simplifier")
+    parser.add_argument("--tolerance", type=float, default=1.)
+    parser.add_argument("--epsilon", type=float, default=15.)
+    parser.add_argument("--orientation", default="histogram", choices=["longest", "circular", "histogram"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra traced run per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="earlier report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    report = runBenchmark(args.sizes, args.shapes, args.angle_noise, args.densify, args.tolerance, args.epsilon, args.orientation, args.repeat, not args.no_memory, args.seed)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print("\nResults written to", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as previous:
+            regressions = compareBenchmarks(json.load(previous), report, args.threshold)
+        for item in regressions:
+            print("REGRESSION %(shape)s x %(buildings)d %(stage)s: %(baseline).4f s -> %(seconds).4f s (x%(ratio).2f)" % item)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,10 +20,143 @@
 
 #packages
 
-import os, arcpy, math, matplotlib, numpy as np, warnings, time
+from __future__ import print_function
+
+import os, sys, math, numpy as np, warnings, time, json, struct, hashlib, argparse, contextlib, threading, codecs
+
+from timeit import default_timer
+
+arcpy = None                                                                                                            # imported on first use by loadArcpy, the native backend never needs it
+_lazy_ = dict(arcpy=False)                                                                                              # whether the arcpy import was attempted
+
+try:
+    import queue
+except ImportError:                                                                                                     # Python 2.7
+    import Queue as queue
+
+try:
+    import tracemalloc
+except ImportError:                                                                                                     # Python 2.7: stage records carry no memory figure
+    tracemalloc = None
 
 warnings.simplefilter(action='ignore', category=FutureWarning)                                                          # ignore FutureWarning from Numpy due to version installed with ArcGIS 10.7
 
+# import arcpy on first use: it takes seconds and checks out a license
+def loadArcpy(required=True):                                                                                           # function to import arcpy once; None, or ImportError when required, where ArcGIS is missing
+    global arcpy
+    if not _lazy_['arcpy']:
+        _lazy_['arcpy'] = True
+        try:
+            import arcpy as module
+            arcpy = module
+        except ImportError:                                                                                             # native shapefile backend runs where ArcGIS isn't installed
+            arcpy = None
+    if arcpy is None and required:
+        raise ImportError("arcpy (ArcGIS) is required for this step, the native backend runs without it")
+    return arcpy
+
+# report progress in ArcMap or on the console
+def addMessage(message):                                                                                                # function to show stage messages with or without arcpy
+    if arcpy is None and 'arcpy' in sys.modules:
+        loadArcpy(required=False)                                                                                       # already imported by ArcMap, so this costs nothing
+    if arcpy is not None:
+        arcpy.AddMessage(message)
+    else:
+        print(message)
+
+#============ stage instrumentation
+
+_instrumentation_ = dict(callbacks=[], threads=threading.local())                                                       # stage record callbacks and, per thread, the stages currently running
+
+_cpu_time_ = time.process_time if hasattr(time, 'process_time') else time.clock                                         # process CPU seconds, time.clock on Python 2.7
+
+# register a function called with the record of every finished stage
+def addStageCallback(callback):                                                                                         # function to subscribe to stage records, returns the callback for removeStageCallback
+    _instrumentation_['callbacks'].append(callback)
+    return callback
+
+# stop sending stage records to a callback
+def removeStageCallback(callback):                                                                                      # function to unsubscribe a callback added with addStageCallback
+    if callback in _instrumentation_['callbacks']:
+        _instrumentation_['callbacks'].remove(callback)
+
+# trace allocations so that stage records carry the memory they allocated
+def traceMemory(enable=True):                                                                                           # function to switch memory tracing on or off, False where tracemalloc is missing
+    if tracemalloc is None:
+        return False
+    if enable and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enable and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return True
+
+# send a finished stage record to every callback
+def _emit_(record):                                                                                                     # function shared by stage and by the parallel pipeline replaying worker records
+    for callback in list(_instrumentation_['callbacks']):
+        callback(record)
+
+# buildings and vertices of a flat buffer, for stage records
+def _sizes_(footprints):                                                                                                # function to count what a stage processed
+    return dict(records=len(footprints['offsets']) - 1, vertices=len(footprints['xy']))
+
+# time one pipeline step and report it to the stage callbacks
+@contextlib.contextmanager
+def stage(name, **fields):                                                                                              # context manager yielding the stage record, the caller fills in records and vertices
+    """Record wall time, CPU time and allocated memory of the enclosed block and pass the record to every callback."""
+    threads = _instrumentation_['threads']
+    if not hasattr(threads, 'stack'):
+        threads.stack = []
+    stack = threads.stack
+    record = dict(stage=name, started=time.time(), records=None, vertices=None, memory=None, depth=len(stack), pid=os.getpid())
+    record.update(fields)
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['_peak'] = max(stack[-1].get('_peak', 0), peak)                                                   # the parent peak so far, before it is reset
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        record['_base'], record['_peak'] = current, current
+    stack.append(record)
+    wall, cpu = default_timer(), _cpu_time_()
+    try:
+        yield record
+    except Exception as error:
+        record['error'] = type(error).__name__
+        raise
+    finally:
+        record['wall'] = default_timer() - wall
+        record['cpu'] = _cpu_time_() - cpu
+        stack.pop()
+        if tracing:
+            peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+            record['memory'] = peak - record.pop('_base')
+            if stack:
+                stack[-1]['_peak'] = max(stack[-1].get('_peak', 0), peak)
+        _emit_(record)
+
+# structured log: one JSON object per stage record
+def jsonLinesSink(path):                                                                                                # function returning a callback that appends stage records to a JSON-lines file
+    def sink(record):
+        with open(path, 'a') as log:
+            log.write(json.dumps(record, sort_keys=True, default=str) + '\n')
+    return sink
+
+# console / ArcMap messages, the former ">> ... DONE!" trail
+def messageSink(record):                                                                                                # function to show every stage record with addMessage
+    message = ">> %s DONE! %.3f s (%.3f s CPU)" % (record['stage'], record['wall'], record['cpu'])
+    if record['records'] is not None:
+        message += ", %d buildings" % record['records']
+    if record['vertices'] is not None:
+        message += ", %d vertices" % record['vertices']
+    if record.get('hits') is not None:
+        message += ", %d from the cache" % record['hits']
+    if record.get('rejected'):
+        message += ", %d rejected" % record['rejected']
+    if record['memory'] is not None:
+        message += ", %.1f MB" % (record['memory'] / 1e6)
+    addMessage("  " * record['depth'] + message)
+
 # validate extension of feature data :: [Adapted for class exercise -- Dr. Nick]
 def controlExtension(inName, ext):                                                                                      # checking for feature class input file type to ensure it end with right format
     if inName.rfind('.') > 0:
@@ -35,14 +168,16 @@ def controlExtension(inName, ext):
 def checkExistence(pathList):                                                                                           # function to check for existence of input feature file
     check = True
     for data in pathList:                                                                                               # looping through the path list to validate if input FeatureClass exists
-        if not arcpy.Exists(data):
+        exists = arcpy.Exists(data) if arcpy is not None else os.path.exists(data)
+        if not exists:
             check = False
-            print '! dataset ' + data + ' is missing'                                                                   # print this statement if data set can't be found in the input folder
+            print('! dataset ' + data + ' is missing')                                                                  # print this statement if data set can't be found in the input folder
             break
     return check
 
 # extracts the field names :: [Adapted for class exercise -- Dr. Nick]
 def getFieldNames(table):                                                                                               # function reads attribute table of FeatureClass and gets fieldNames
+    loadArcpy()
     fnames = []
     fields = arcpy.ListFields(table)                                                                                    # arcpy function that handles listing of fields in attribute table
     if fields:
@@ -70,70 +205,106 @@ def outputFiles(outputList):
     return file
 
 # Generalize/simplify polygon -- remove unnecessary polygon vertices -- Douglas-Peucker Algorithm
-def simplifyBuilding(inFC, outFC):                                                                                      # function to simplify building polygons by removing vertices at a tolerance of 1meter
-    arcpy.SimplifyPolygon_cartography(inFC, outFC, algorithm="POINT_REMOVE", tolerance=1, minimum_area=0)
+def simplifyBuilding(inFC, outFC, tolerance=1):                                                                         # function to simplify building polygons by removing vertices at a tolerance of 1meter
+    loadArcpy()
+    arcpy.SimplifyPolygon_cartography(inFC, outFC, algorithm="POINT_REMOVE", tolerance=tolerance, minimum_area=0)
 
 # convert polygon to line
 def polygonToLine(inFC, outFC):                                                                                         # function to convert polygon/building to continous polyline using default paramaters
+    loadArcpy()
     arcpy.PolygonToLine_management(inFC, outFC)
 
 # split polygon polylines at vertices
 def polylineToSegments(inFC, outFC):                                                                                    # function to convert building polyline to line segments 
+    loadArcpy()
     arcpy.SplitLine_management(inFC, outFC)
 
-# get building coordinates in arrays
-def _building_arr_(geometry):                                                                                           # function to get building vertex coordinates and store in an array
-    """Return building coordinates."""
-    def _split_(part):
-        yield [(p.X, p.Y) for p in part if p]
-        
-    coords =[]                                                                                                          # closed array of coordinates (first vertex squeezed at end of array).
-    for part in geometry:                                                                                               # loop through the geometry parts and push coordinates in an array using numpy
-        output = []
-        w = np.where(np.in1d(part, None, invert=False))[0]
-        bits = np.split(part, w)
-        for bit in bits:
-            geom_sub = _split_(bit)
-            output.append(np.array(*geom_sub).squeeze())
-        coords.append(np.asarray(output).squeeze())
-    return np.asarray(coords)                                                                                           # return numpy array of coordinates
+# 2D geometry kind and coordinates per point of WKB type codes: ISO adds 1000 (Z), 2000 (M) or 3000 (ZM), EWKB sets flag bits
+def _wkb_types_(code):                                                                                                  # function to split WKB type codes into the kind and the number of doubles per point
+    code = np.asarray(code, dtype=np.int64)
+    if np.any(code & 0x20000000):
+        raise ValueError("EWKB with an embedded SRID is not supported")
+    kind, iso = (code & 0x0fffffff) % 1000, (code & 0x0fffffff) // 1000
+    if np.any(iso > 3):
+        raise ValueError("unknown WKB geometry type %d" % code[iso > 3][0])
+    hasZ = ((code & 0x80000000) != 0) | (iso == 1) | (iso == 3)
+    hasM = ((code & 0x40000000) != 0) | (iso == 2) | (iso == 3)
+    return kind, 2 + hasZ.astype(np.int64) + hasM
+
+# ring start, point count, owning feature and doubles per point of every ring of concatenated little-endian WKB geometries
+def _wkb_rings_(buf, starts):                                                                                           # function to walk the WKB headers of all geometries at once, one step per part and ring
+    if len(starts) and np.any(_gather_(buf, starts, 'u1') != 1):
+        raise ValueError("only little-endian WKB is supported")
+    kind, _ = _wkb_types_(_gather_(buf, starts + 1, '<u4') if len(starts) else np.zeros(0, dtype=np.uint32))
+    multi = (kind == 5) | (kind == 6)                                                                                   # MultiLineString and MultiPolygon
+    members = np.where(multi, _gather_(buf, starts + 5, '<u4') if len(starts) else 0, 1).astype(np.int64)
+    at = np.where(multi, starts + 9, starts)
+    found = []                                                                                                          # (feature, member, ring, first point, points, doubles per point) per round
+    for member in range(int(members.max()) if len(members) else 0):
+        owner = np.flatnonzero(members > member)
+        kind, dims = _wkb_types_(_gather_(buf, at[owner] + 1, '<u4'))                                                   # every member has its own type code
+        polygon = kind == 3
+        count = np.ones(len(owner), dtype=np.int64)
+        count[polygon] = _gather_(buf, at[owner][polygon] + 5, '<u4')
+        cursor = at[owner] + np.where(polygon, 9, 5)
+        for ring in range(int(count.max()) if len(count) else 0):
+            active = count > ring
+            points = _gather_(buf, cursor[active], '<u4').astype(np.int64)
+            found.append((owner[active], np.full(len(points), member), np.full(len(points), ring), cursor[active] + 4, points, dims[active]))
+            cursor[active] += 4 + 8 * dims[active] * points                                                             # z and m follow x and y in every point
+        at[owner] = cursor
+    if not found:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+    feature, member, ring, first, points, dims = [np.concatenate(column) for column in zip(*found)]
+    order = np.lexsort((ring, member, feature))                                                                         # rings in feature, part and ring order
+    return first[order], points[order], feature[order], dims[order]
+
+# read every ring of a feature class into one flat coordinate buffer with ring and feature offsets
+def readRings(inFC, idField="OID@"):                                                                                    # function to replace the per-building point lists of _building_arr_ with a ragged array
+    """Return 'xy', ring 'offsets', feature 'ring_offsets' and 'ids' of every ring of inFC."""
+    loadArcpy()
+    ids, blobs = [], []
+    with arcpy.da.SearchCursor(inFC, [idField, "SHAPE@WKB"]) as cur:                                                    # one bytes object per feature, no point objects
+        for oid, wkb in cur:
+            ids.append(oid)
+            blobs.append(bytes(wkb or b''))
+    sizes = np.array([len(blob) for blob in blobs], dtype=np.int64)
+    buf = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+    filled = sizes > 0
+    first, points, feature, dims = _wkb_rings_(buf, starts[filled])
+    feature = np.flatnonzero(filled)[feature]
+    keep = points > 0
+    first, points, feature, dims = first[keep], points[keep], feature[keep], dims[keep]
+
+    point = np.repeat(first, points) + np.repeat(8 * dims, points) * _ranges_(np.zeros(len(points)), points)            # only x and y of every point are read
+    position = (point[:, None] + np.array([0, 8])).ravel()
+    rings = dict()
+    rings['xy'] = _gather_(buf, position, '<f8').reshape(-1, 2)
+    rings['offsets'] = np.concatenate(([0], np.cumsum(points))).astype(np.int64)
+    rings['ring_offsets'] = np.searchsorted(feature, np.arange(len(ids) + 1)).astype(np.int64)
+    rings['ids'] = np.asarray(ids, dtype=np.int64)
+    return rings
 
 # get angles of polygons or polylines (polylines here should not be split but rather continuous)
-def _building_angles_(a, inside=True, in_degrees=True):                                                                 # function to compute building vertex angles
-
-    def _xy_(a):
-        ba = a - np.concatenate((a[-1, None], a[:-1]), axis=0)
-        bc = a - np.concatenate((a[1:], a[0, None]), axis=0)
-        return np.cross(ba, bc), ba, bc                                                                                 # cross product for vector computation
-
-    if np.allclose(a[0], a[-1]):                                                                                        # closed loop, remove duplicates
-        a = a[:-1]                                                                                                      # vertex coordinates
-    cr, ba, bc = _xy_(a)
-    dt = np.einsum('ij,ij->i', ba, bc)
-    angle = np.arctan2(cr, dt)                                                                                          # angle here in radian
-    
-    if inside:                                                                                                          # with "inside" True is returned for computation of interior angles.
-        angles = np.where(angle < 0, angle + (np.pi * 2.), angle)
-    else:
-        angles = np.where(angle > 0, (np.pi * 2.) - angle, angle)
-    if in_degrees:                                                                                                      # with "in_degrees" True for degrees while False for radians angle computation
-        angles = np.degrees(angles)                                                                                     # radians angle to degrees computation
-    return angles
+def _building_angles_(a, inside=True, in_degrees=True, offsets=None):                                                   # function to compute building vertex angles, of one ring or of all open rings given by offsets
+    if offsets is None:                                                                                                 # one ring
+        if np.allclose(a[0], a[-1]):                                                                                    # closed loop, remove duplicates
+            a = a[:-1]                                                                                                  # vertex coordinates
+        offsets = np.array([0, len(a)], dtype=np.int64)
+    prv, nxt = _neighbours_(offsets)                                                                                    # previous and next vertex within each ring
+    return _vertex_angles_(a - a[prv], a - a[nxt], inside, in_degrees)                                                  # "inside" for interior angles, "in_degrees" for degrees instead of radians
 
 # get polygon angles
 def geomAngles(inFC):                                                                                                   # function to compute actual angles of geometry
-    with arcpy.da.SearchCursor(inFC, "SHAPE@") as cur:
-        angles = []                                                                                                     # store all angles in array
-        for row in cur:
-            geom = row[0]                                                                                               # field index 0 contains shape geometry
-            arr = _building_arr_(geom).squeeze()                                                                        # adds an extra list
-            ang = _building_angles_(arr, inside=True, in_degrees=True).tolist()                                         # to list to convert to standard python list
-            
-            angles.append(ang)
-        return angles
+    rings = readRings(inFC)                                                                                             # one flat buffer for the whole feature class
+    xy, offsets, _ = _open_rings_(rings['xy'], rings['offsets'])
+    angles = _building_angles_(xy, inside=True, in_degrees=True, offsets=offsets)                                       # all rings in one pass
+    return np.split(angles, offsets[rings['ring_offsets'][1:-1]])                                                       # one view per feature, no copies
 
 # get building angles at each vertex
 def buildingVertexAngle(table, angles):                                                                                 # function to assign building interior angles to a field
+    loadArcpy()
 
     arcpy.AddField_management(table,"Angle","DOUBLE")                                                                   # create a new field called "Angle" and set to data type "DOUBLE"
 
@@ -157,6 +328,7 @@ def buildingVertexAngle(table, angles):
 
 # get building angles error (!= 90 degrees) at each vertex
 def buildingVertexError(table, angles):                                                                                 # function to compute difference in vertex angle not orthogonal
+    loadArcpy()
     arcpy.AddField_management(table,"Angle_Err","DOUBLE")
 
     pointer = 0
@@ -178,29 +350,26 @@ def buildingVertexError(table, angles):
         return angleError
 
 # split polyline length computation algorithm
-def _length_(geom):                                                                                                     # function to compute length
-    def _calc_(b):
-        diff = b[:-1] - b[1:]                                                                                           # compute difference in length using coordinates of line segments
-        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
-    return _calc_(geom)
+def _length_(geom, offsets=None):                                                                                       # function to compute length, of one line or of all lines given by offsets
+    diff = geom[:-1] - geom[1:]                                                                                         # compute difference in length using coordinates of line segments
+    lengths = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+    if offsets is None:
+        return lengths
+    ends = offsets[1:-1]
+    keep = np.ones(len(lengths), dtype=bool)
+    keep[ends[ends > 0] - 1] = False                                                                                    # no segment from the end of one line to the start of the next
+    return lengths[keep]
 
 # get length of split polyline
 def geomLength(inFC):                                                                                                   # function to compute length of geometry
-    with arcpy.da.SearchCursor(inFC, "SHAPE@") as cur:                                                                  # searching for each segment to compute length
-        _lengths = []
-        _arrs = []
-        for row in cur:
-            geom = row[0]
-            arr = _building_arr_(geom).squeeze()                                                                        # squeeze to remove external appending brackets
-            length = _length_(arr)
-
-            _lengths.append(length)                                                                                     # append length to array of lengths
-            _arrs.append(arr)
-
-        return _lengths
+    rings = readRings(inFC)
+    lengths = _length_(rings['xy'], rings['offsets'])                                                                   # all lines in one pass
+    segments = np.concatenate(([0], np.cumsum(np.diff(rings['offsets']) - 1))).astype(np.int64)                         # a line of n points has n - 1 segments
+    return np.split(lengths, segments[rings['ring_offsets'][1:-1]])
 
 # get building edge/segment length
 def buildingLengths(table, lengths):                                                                                    # function to compute building length and store in table
+    loadArcpy()
 
     arcpy.AddField_management(table,"Length","DOUBLE")                                                                  # add a field called "Length" of type "Double"
 
@@ -223,79 +392,38 @@ def buildingLengths(table, lengths):
 
 # building segments coordinates
 def geomCoords(inFC):                                                                                                   # function to store coordinates of each segment for later reuse
-    fieldList = ["SHAPE@", "RIGHT_FID", "Angle", "Length"]
-    with arcpy.da.SearchCursor(inFC, fieldList) as cur:                                                                 # use a cursor to search each segment
-
-        Coords = []
-        for row in cur:
-            geom = row[0]
-            arr = _building_arr_(geom).squeeze()
-            Coords.append( arr )
-        return Coords                                                                                                   # returns an array of the coordinates of each line segment
+    rings = readRings(inFC)
+    return np.split(rings['xy'], rings['offsets'][rings['ring_offsets'][1:-1]])                                         # returns an array of the coordinates of each line segment
 
 # building edge longest side
-def geoMaxLength(inFC):                                                                                                 # function to compute maximum length of each segment to be used as reference side
-    coords = geomCoords(inFC)                                                                                           # using function defined above to get coordinates of building line segments
-    groups = []                                                                                                         # store each maximum building segment and reuse to get it index location 
+def geoMaxLength(inFC, summary=None):                                                                                   # function to compute maximum length of each segment to be used as reference side
+    if summary is None:
+        summary = geomEdgeSummary(inFC)                                                                                 # one scan of the split segments instead of a geomCoords rescan
+    segments = ringSegments(summary)
+    longest = segments[summary['offsets'][:-1] + summary['max_index']]
     buildings = dict()                                                                                                  # dictionary to store building info as key-value pair
-    items = 0
 
-    for i, coord in enumerate(coords):
-        groups.append(coord)
-
-        if i % 4 == 0:
-            groups = []
-            groups.append(coords[i])
-
-        if len(groups) == 4:
-            lengths = []
-            for j in groups:
-                length = _length_(j)
-                lengths.append(length)
-            lengths = np.array(lengths)
-
-            maxlen = np.max(lengths)                                                                                    # get segment with maximum length 
-            loc = np.argmax(lengths)                                                                                    # get index location of that segment with maximum length
-
-            buildings[items] = dict()
-            buildings[items]['max_coord'] = groups[loc]
-            buildings[items]['max_len'] = maxlen
-            buildings[items]['max_index'] = loc
-        
-            items = items + 1
+    for items, (loc, maxlen) in enumerate(zip(summary['max_index'].tolist(), summary['max_length'].tolist())):
+        buildings[items] = dict()
+        buildings[items]['max_coord'] = longest[items]
+        buildings[items]['max_len'] = maxlen
+        buildings[items]['max_index'] = loc
 
     return buildings                                                                                                    # return the buildings
 
 # building edge shortest side
-def geoMinLength(inFC):                                                                                                 # function to compute minimum length of each segment to be used as reference side
-    coords = geomCoords(inFC)                                                                                           # using function defined previously to get coordinates of building line segments    
-    groups = []                                                                                                         # store each minimum building segment and reuse to get it index location 
-    buildings = dict()                                                                                                  # dictionary to store building info as key-value pair
-    items = 0
-
-    for i, coord in enumerate(coords):
-        groups.append(coord)
-
-        if i % 4 == 0:
-            groups = []
-            groups.append(coords[i])
-
-        if len(groups) == 4:
-            lengths = []
-            for i in groups:
-                length = _length_(i)
-                lengths.append(length)
-            lengths = np.array(lengths)
-
-            minlen = np.min(lengths)                                                                                    # get segment with minimum length 
-            loc = np.argmin(lengths)                                                                                    # get index location of that segment with minimum length
-
-            buildings[items] = dict()
-            buildings[items]['min_coord'] = groups[loc]
-            buildings[items]['min_len'] = minlen
-            buildings[items]['min_index'] = loc
-        
-            items = items + 1
+def geoMinLength(inFC, summary=None):                                                                                   # function to compute minimum length of each segment to be used as reference side
+    if summary is None:
+        summary = geomEdgeSummary(inFC)
+    segments = ringSegments(summary)
+    shortest = segments[summary['offsets'][:-1] + summary['min_index']]
+    buildings = dict()
+
+    for items, (loc, minlen) in enumerate(zip(summary['min_index'].tolist(), summary['min_length'].tolist())):
+        buildings[items] = dict()
+        buildings[items]['min_coord'] = shortest[items]
+        buildings[items]['min_len'] = minlen
+        buildings[items]['min_index'] = loc
 
     return buildings
 
@@ -309,8 +437,9 @@ def calculateNewCoord(a, b, alpha, min_length):
 def bringAllTogether(inFC):                                                                                            # function to bring new vertex positions of buildings together and in ther order
 
     geo_sides = 4                                                                                                       # fixed building geometry constraint of 4 vertices, that is, rectangle
-    max_sides = geoMaxLength(inFC)
-    min_sides = geoMinLength(inFC)
+    summary = geomEdgeSummary(inFC)                                                                                     # single scan shared by both sides
+    max_sides = geoMaxLength(inFC, summary)
+    min_sides = geoMinLength(inFC, summary)
 
     all_coords = []
 
@@ -356,14 +485,50 @@ def bringAllTogether(inFC):
 
     return all_coords                                                                                                   # all coordinates of the buildings
 
+# building corners of the split segments as one contiguous (N, 4, 2) array
+def geomCorners(inFC):                                                                                                  # function to read every segment start vertex in a single bulk read
+    loadArcpy()
+    points = arcpy.da.FeatureClassToNumPyArray(inFC, ["SHAPE@XY"], explode_to_points=True)                              # two points (start, end) per split segment
+    starts = np.asarray(points["SHAPE@XY"], dtype=np.float64)[::2]                                                      # segment i starts at corner i of its building
+    buildings = len(starts) // 4                                                                                        # same grouping of 4 segments per building as geoMaxLength
+    return np.ascontiguousarray(starts[:buildings * 4].reshape(buildings, 4, 2))
+
+# vectorized batch of bringAllTogether: longest edge offset by the shortest edge for all rectangles at once
+def regularizeCorners(corners):                                                                                         # function to compute new vertices of all buildings from a (N, 4, 2) corner array
+    """Return regularized (N, 4, 2) corners in polygon order."""
+    corners = np.ascontiguousarray(corners, dtype=np.float64)
+    edges = np.roll(corners, -1, axis=1) - corners                                                                      # segment i runs from corner i to corner i + 1
+    lengths = np.sqrt(np.einsum('ijk,ijk->ij', edges, edges))
+
+    rows = np.arange(len(corners))
+    max_index = np.argmax(lengths, axis=1)                                                                              # index of the longest segment, as in geoMaxLength
+    min_length = np.min(lengths, axis=1)                                                                                # length of the shortest segment, as in geoMinLength
+
+    first = corners[rows, max_index]
+    second = corners[rows, (max_index + 1) % 4]
+    alpha = np.arctan2(second[:, 1] - first[:, 1], second[:, 0] - first[:, 0])                                          # azimuth of the longest segment
+
+    offset = np.empty((len(corners), 2))                                                                                # perpendicular offset of calculateNewCoord
+    offset[:, 0] = min_length * np.cos(alpha + np.pi/2.)
+    offset[:, 1] = min_length * np.sin(alpha + np.pi/2.)
+
+    fixed = np.empty_like(corners)                                                                                      # same vertex order as fixedSegments
+    fixed[:, 0] = np.abs(offset - first)
+    fixed[:, 1] = first
+    fixed[:, 2] = second
+    fixed[:, 3] = np.abs(offset - second)
+    return fixed
+
 # create an empty shapefile to store resulting orthogonal buidlings
 def createEmptyShapefile(output_path, fc_name, spatReference):
+    loadArcpy()
     arcpy.CreateFeatureclass_management(output_path, fc_name, "POLYGON", "",
                                         "DISABLED", "DISABLED",
                                         spatReference)
 
 # coupling of fixed building segments back into a polygon (rectangle)
 def fixedSegments(coords, outFC):                                                                                       # function to form new buildings with true orthogonal segments
+    loadArcpy()
     arcpy.AddField_management(outFC,"RIGHT_ID","LONG")                                                                  # add a field "RIGHT_ID" with data type "LONG" to store building polygon index
     
     with arcpy.da.InsertCursor(outFC, ["SHAPE@", "RIGHT_ID"]) as cursor:
@@ -393,149 +558,2134 @@ def fixedSegments(coords, outFC):
                 cursor.insertRow([polygon,id])                                                                          # insert new building "SHAPE" geometry row by row
             except UnboundLocalError as e:
                 pass
-            
-
-
-
-#******************** FUNCTION CALL SECTION *******************************
-# output
-arcpy.env.overwriteOutput = True
-
-# get file current directory -- change forward slash to backslash
-currDirectory = ( os.path.dirname(os.path.realpath(__file__)) ).replace(os.sep, '/')
-
-# TODO: create output directory programmatically and see how to handle input directory also
-subdirList = ['temp', 'output']
-
-# set current directory as workspace
-workspace = currDirectory
-
-# create subdirectory
-createSubdir(workspace, subdirList)
-
-# input
-# TODO: allow users to enter input feature in "input" folder
-inFCName = 'test_buildings.shp'
-
-# validate file extension
-inFCName = controlExtension(inFCName, '.shp')
-
-# get complete path of input feature
-inFC = completePath(workspace, 'input', [inFCName])[0]
-
-# print "FieldNames of inputFC: ", getFieldNames(inFC)
-
-#=========== processing files output list
-outputFCNames = ['simplifyBuildings', 'polylines', 'splitPolyline', 'fixedBuildings']
-
-# output function call
-outputFile = outputFiles(outputFCNames)
-
-
-simplifyBuildingsFC = completePath(workspace, 'temp', [ outputFile[0] ] )[0]
-polyLinesFC = completePath(workspace, 'temp', [ outputFile[1] ] )[0]
-splitLinesFC = completePath(workspace, 'temp', [ outputFile[2] ] )[0]
-fixedBuildingsFC = completePath(workspace, 'output', [ outputFile[3] ] )[0]
-
-fixedBuildingsFC = "fixedBuildings.shp"
-
-
 
-#************** FUNCTION CALLS
+# write regularized flat footprints (any vertex count) back as polygons
+def fixedFootprints(footprints, outFC):                                                                                 # function to form new buildings from a flat coordinate buffer with arcpy
+    loadArcpy()
+    arcpy.AddField_management(outFC,"RIGHT_ID","LONG")
 
-start_time = time.time()                                                                                    # function to compute time of python file execution
-
-print "\t"
-arcpy.AddMessage("******** CLOSE ALL FILES EXCEPT INPUT IN ARCMAP BEFORE RUNNING SCRIPT ********")
-
-print "\t"
-check = checkExistence([inFC])
-print "Is input FeatureClass available?: ", check, "\n", "InFC: \t \t \t \t  ", inFC
-print "\t"
-arcpy.AddMessage(">> Input FeatureClass check DONE!")
-
-print "\n"
-
-simplifyBuilding(inFC, simplifyBuildingsFC)
-arcpy.AddMessage(">> Building polygon simplification -- Douglas-Peucker Algorithm -- DONE!")
-
-print "\n"
-
-polygonToLine(simplifyBuildingsFC, polyLinesFC)
-arcpy.AddMessage(">> Polygon to polyline DONE!")
-
-print "\n"
-
-polylineToSegments(polyLinesFC, splitLinesFC)
-arcpy.AddMessage(">> Split polyline to segments DONE!")
-
-print "\n"
-
-angles = geomAngles(polyLinesFC)
-arcpy.AddMessage(">> Get building geometry angles DONE!")
-
-print "\n"
-
-measured_angle = buildingVertexAngle(splitLinesFC, angles)
-arcpy.AddMessage(">> Assign building angles DONE!")
-
-print "\n"
-
-buildingVertexError(splitLinesFC, measured_angle)
-arcpy.AddMessage(">> Vertex building error angles DONE!")
-
-print "\n"
-
-lengths = geomLength(splitLinesFC)
-arcpy.AddMessage(">> Assign building lengths DONE!")
-
-print "\n"
-
-buildingLengths(splitLinesFC, lengths)
-arcpy.AddMessage(">> Get building lengths DONE!")
-
-print "\n"
-
-geomCoords(splitLinesFC)
-arcpy.AddMessage(">> Get building coordinates DONE!")
-
-print "\n"
-
-geoMaxLength(splitLinesFC)
-arcpy.AddMessage(">> Get maximum lengths DONE!")
-
-print "\n"
-
-geoMinLength(splitLinesFC)
-arcpy.AddMessage(">> Get minimum lengths DONE!")
-
-print "\n"
-
-spatRef = arcpy.Describe(inFC).spatialReference
-arcpy.AddMessage(">> Spatial Reference acquisition DONE!")
-
-print "\n"
-
-createEmptyShapefile(workspace + "/output", fixedBuildingsFC, spatRef)
-arcpy.AddMessage(">> Empty shapefile creation DONE!")
+    xy, offsets = footprints['xy'].tolist(), footprints['offsets'].tolist()
+    with arcpy.da.InsertCursor(outFC, ["SHAPE@", "RIGHT_ID"]) as cursor:
+        for id, start, end in zip(footprints['ids'].tolist(), offsets[:-1], offsets[1:]):
+            array = arcpy.Array([arcpy.Point(x, y) for x, y in xy[start:end]])
+            cursor.insertRow([arcpy.Polygon(array), id])
 
-print "\n"
+# write regularized (N, 4, 2) corners back as polygons
+def fixedPolygons(corners, outFC, ids=None):                                                                            # function to form new buildings from the batch of regularized corners
+    loadArcpy()
+    arcpy.AddField_management(outFC,"RIGHT_ID","LONG")
 
-fixedCoord = bringAllTogether(splitLinesFC)
-arcpy.AddMessage(">> Bring it all together DONE!")
+    if ids is None:
+        ids = np.arange(len(corners))                                                                                   # building polygon index, as in fixedSegments
 
-print "\n"
+    with arcpy.da.InsertCursor(outFC, ["SHAPE@", "RIGHT_ID"]) as cursor:
+        for id, ring in zip(ids.tolist(), corners.tolist()):                                                            # one tolist for the whole batch instead of per vertex
+            array = arcpy.Array([arcpy.Point(x, y) for x, y in ring])
+            cursor.insertRow([arcpy.Polygon(array), id])
+
+
+
+# drop the closing vertex of every ring in a flat coordinate buffer
+def _open_rings_(xy, offsets):                                                                                          # function to turn closed rings (first vertex repeated at the end) into open rings
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    closed = (ends > starts) & np.all(xy[starts] == xy[ends], axis=1)
+    keep = np.ones(len(xy), dtype=bool)
+    keep[ends[closed]] = False
+    counts = np.diff(offsets) - closed
+    return xy[keep], np.concatenate(([0], np.cumsum(counts))).astype(np.int64), closed
+
+# previous and next vertex of every vertex in a flat buffer of open rings
+def _neighbours_(offsets):                                                                                              # function to index the ring neighbours without splitting the buffer per building
+    counts = np.diff(offsets)
+    index = np.arange(offsets[-1])
+    start = np.repeat(offsets[:-1], counts)
+    local = index - start
+    size = np.repeat(counts, counts)
+    return start + (local - 1) % size, start + (local + 1) % size
+
+# read footprints once into a flat in-memory coordinate buffer
+def readFootprints(inFC):                                                                                               # function to read all building vertices in one bulk read
+    """Return footprints (first ring per feature) with ids, part counts and ring closure, as readShapefile."""
+    loadArcpy()
+    idField = "InPoly_FID" if "InPoly_FID" in getFieldNames(inFC) else "OID@"                                           # keep the input feature id through simplification
+    rings = readRings(inFC, idField)
+    parts = np.diff(rings['ring_offsets'])                                                                              # holes and further parts, counted as in the shapefile part count
+    exterior = rings['ring_offsets'][:-1][parts > 0]                                                                    # null geometries have no ring
+    counts = np.diff(rings['offsets'])[exterior]
+    xy = rings['xy'][_ranges_(rings['offsets'][exterior], counts)]
+    xy, offsets, closed = _open_rings_(xy, np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+
+    footprints = dict()                                                                                                 # dictionary to store the buildings as flat arrays
+    footprints['xy'] = xy
+    footprints['offsets'] = offsets
+    footprints['ids'] = rings['ids'][parts > 0]
+    footprints['parts'] = parts[parts > 0]
+    footprints['closed'] = closed
+    return footprints
+
+# in-memory equivalent of polygonToLine + polylineToSegments
+def ringSegments(footprints):                                                                                           # function to build the (S, 2, 2) start/end coordinates of every building segment
+    xy = footprints['xy']
+    _, nxt = _neighbours_(footprints['offsets'])
+    return np.stack((xy, xy[nxt]), axis=1)
+
+# interior (or exterior) angle from the vectors to the previous and the next vertex
+def _vertex_angles_(ba, bc, inside=True, in_degrees=True):                                                              # function with the angle math of _building_angles_ for flat arrays
+    cr = ba[:, 0] * bc[:, 1] - ba[:, 1] * bc[:, 0]                                                                      # same cross and dot products as _building_angles_
+    dt = np.einsum('ij,ij->i', ba, bc)
+    angle = np.arctan2(cr, dt)
 
-fixedSegments(fixedCoord, workspace + "/output/" + fixedBuildingsFC)
-arcpy.AddMessage(">> Creating fixed segments DONE!")
-print "Output is here: \t \t \t ", workspace + "/output/" + fixedBuildingsFC
+    if inside:
+        angles = np.where(angle < 0, angle + (np.pi * 2.), angle)
+    else:
+        angles = np.where(angle > 0, (np.pi * 2.) - angle, angle)
+    if in_degrees:
+        angles = np.degrees(angles)
+    return angles
 
-print "\n"
+# in-memory equivalent of geomAngles for every building at once
+def ringAngles(footprints, inside=True, in_degrees=True):                                                               # function to compute the vertex angles of all buildings
+    return _building_angles_(footprints['xy'], inside, in_degrees, footprints['offsets'])
+
+# in-memory equivalent of geomLength for every building at once
+def ringLengths(segments):                                                                                              # function to compute the length of all building segments
+    diff = segments[:, 0] - segments[:, 1]
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+# signed area of every ring in a flat buffer (shoelace formula)
+def _ring_area_(xy, offsets):                                                                                           # function to compute the signed area of all rings at once, negative when clockwise
+    _, nxt = _neighbours_(offsets)
+    cross = xy[:, 0] * xy[nxt, 1] - xy[nxt, 0] * xy[:, 1]
+    return np.add.reduceat(cross, offsets[:-1]) / 2.
+
+# keep a subset of buildings (and optionally of their vertices) of a flat buffer
+def _subset_(footprints, rings=None, vertices=None):                                                                    # function to filter buildings without a per-building loop
+    counts = np.diff(footprints['offsets'])
+    buildings = len(counts)
+    wholeRings = vertices is None
+    if vertices is None:
+        vertices = np.ones(len(footprints['xy']), dtype=bool)
+    if rings is None:
+        rings = np.ones(buildings, dtype=bool)
+    vertices = vertices & np.repeat(rings, counts)
+    kept = np.add.reduceat(vertices.astype(np.int64), footprints['offsets'][:-1]) if buildings else counts
+
+    subset = dict()
+    for key in footprints:                                                                                              # per-building and per-vertex arrays follow the mask, everything else is copied as is
+        value = footprints[key]
+        if key in ('xy', 'offsets'):
+            continue
+        if key in _SUMMARY_KEYS_ and not wholeRings:                                                                    # removing vertices invalidates the edge summary
+            continue
+        if isinstance(value, np.ndarray) and len(value) == buildings:
+            subset[key] = value[rings]
+        elif isinstance(value, np.ndarray) and len(value) == len(footprints['xy']) and buildings:
+            subset[key] = value[vertices]
+        else:
+            subset[key] = value
+    subset['xy'] = footprints['xy'][vertices]
+    subset['offsets'] = np.concatenate(([0], np.cumsum(kept[rings]))).astype(np.int64)
+    return subset
+
+# distance of points to the segments between two anchor points
+def _segment_distance_(p, a, b):                                                                                        # function to compute the point to segment distance for arrays of points
+    ab = b - a
+    ap = p - a
+    denom = np.einsum('ij,ij->i', ab, ab)
+    t = np.einsum('ij,ij->i', ap, ab) / np.where(denom > 0, denom, 1.)
+    t = np.clip(t, 0., 1.)
+    d = ap - t[:, None] * ab
+    return np.sqrt(np.einsum('ij,ij->i', d, d))
+
+# first index of the maximum of every group in a flat array
+def _group_argmax_(values, group, starts):                                                                              # function to find the position of each group maximum
+    best = np.maximum.reduceat(values, starts)
+    hits = np.flatnonzero(values >= best[group])
+    _, first = np.unique(group[hits], return_index=True)
+    return hits[first], best
+
+# Douglas-Peucker hierarchy on all rings at once: every iteration splits every open chain of every building
+def _douglas_peucker_levels_(xy, offsets, floor=-np.inf):                                                               # function to compute, per vertex, the largest tolerance that still keeps it
+    """Return per vertex the largest tolerance whose Douglas-Peucker run keeps it."""
+    counts = np.diff(offsets)
+    levels = np.full(len(xy), -np.inf)
+    levels[offsets[:-1]] = np.inf
+    levels[np.repeat(counts < 4, counts)] = np.inf                                                                      # triangles and degenerate rings cannot be simplified
+
+    rings = np.flatnonzero(counts >= 4)
+    if len(rings) == 0:
+        return levels
+
+    # closed buffer: the first vertex of every ring repeated at its end, so chains never wrap
+    closedCounts = counts[rings] + 1
+    closedStarts = np.concatenate(([0], np.cumsum(closedCounts)[:-1]))
+    closedIndex = np.repeat(offsets[rings] - closedStarts, closedCounts) + np.arange(closedCounts.sum())
+    closedIndex[closedStarts + closedCounts - 1] = offsets[rings]                                                       # closing vertex maps back to the first vertex
+    closed = xy[closedIndex]
+
+    # split every ring at its first vertex and the vertex farthest from it
+    group = np.repeat(np.arange(len(rings)), closedCounts)
+    first = closed[np.repeat(closedStarts, closedCounts)]
+    far, _ = _group_argmax_(np.sqrt(np.sum((closed - first) ** 2, axis=1)), group, closedStarts)
+    levels[closedIndex[far]] = np.inf
+
+    heads = np.concatenate((closedStarts, far))
+    tails = np.concatenate((far, closedStarts + closedCounts - 1))
+    caps = np.full(len(heads), np.inf)                                                                                  # a chain only exists for tolerances below the levels of its ancestors
+
+    while len(heads):
+        inner = tails - heads - 1
+        live = inner > 0
+        heads, tails, caps, inner = heads[live], tails[live], caps[live], inner[live]
+        if len(heads) == 0:
+            break
 
+        chain = np.repeat(np.arange(len(heads)), inner)
+        starts = np.concatenate(([0], np.cumsum(inner)[:-1]))
+        points = np.repeat(heads + 1 - starts, inner) + np.arange(inner.sum())
+        dist = _segment_distance_(closed[points], closed[heads[chain]], closed[tails[chain]])
+
+        loc, best = _group_argmax_(dist, chain, starts)
+        split = best > floor                                                                                            # chains within floor drop all their inner vertices
+        mid = points[loc[split]]
+        level = np.minimum(best[split], caps[split])
+        levels[closedIndex[mid]] = level
+
+        heads, tails = np.concatenate((heads[split], mid)), np.concatenate((mid, tails[split]))
+        caps = np.concatenate((level, level))
+    return levels
+
+# Douglas-Peucker on all rings at once, optionally from precomputed levels
+def _douglas_peucker_(xy, offsets, tolerance, levels=None):                                                             # function to flag the vertices kept by Douglas-Peucker
+    if levels is None:
+        levels = _douglas_peucker_levels_(xy, offsets, tolerance)
+    keep = levels > tolerance
+
+    # the first vertex is only an anchor: drop it too when it lies on the chord of its kept neighbours
+    live = np.flatnonzero(keep)
+    liveCounts = np.add.reduceat(keep.astype(np.int64), offsets[:-1]) if len(offsets) > 1 else np.zeros(0, np.int64)
+    liveOffsets = np.concatenate(([0], np.cumsum(liveCounts))).astype(np.int64)
+    prv, nxt = _neighbours_(liveOffsets)
+    anchors = liveOffsets[:-1][liveCounts > 3]
+    dist = _segment_distance_(xy[live[anchors]], xy[live[prv[anchors]]], xy[live[nxt[anchors]]])
+    keep[live[anchors[dist <= tolerance]]] = False
+    return keep
+
+# point remove on all rings at once: drop vertices closer than the tolerance to the chord of their neighbours
+def _point_remove_(xy, offsets, tolerance):                                                                             # function to flag the vertices kept by iterative point removal
+    keep = np.ones(len(xy), dtype=bool)
+    index = np.arange(len(xy))
+    while True:
+        live = index[keep[index]]
+        counts = np.add.reduceat(keep.astype(np.int64), offsets[:-1]) if len(offsets) > 1 else np.zeros(0, np.int64)
+        liveOffsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        prv, nxt = _neighbours_(liveOffsets)
+        dist = _segment_distance_(xy[live], xy[live[prv]], xy[live[nxt]])
+
+        order = np.arange(len(live))
+        candidate = dist < tolerance
+        candidate &= (dist < dist[prv]) | ((dist == dist[prv]) & (order < prv))                                         # only local minima go, so two neighbours never go in one pass
+        candidate &= (dist < dist[nxt]) | ((dist == dist[nxt]) & (order < nxt))
+        removed = np.add.reduceat(candidate.astype(np.int64), liveOffsets[:-1]) if len(counts) else counts
+        candidate &= np.repeat(counts - removed >= 3, counts)                                                           # a ring keeps at least three vertices
+        if not candidate.any():
+            return keep
+        keep[live[candidate]] = False
+
+# pure NumPy replacement of simplifyBuilding for flat in-memory footprints
+def simplifyRings(footprints, tolerance=1., minimum_area=0., algorithm="DOUGLAS_PEUCKER", levels=None):                 # function to simplify all buildings at once without arcpy
+    """Return simplified footprints; rings below minimum_area are dropped."""
+    xy, offsets = footprints['xy'], footprints['offsets']
+    if algorithm == "DOUGLAS_PEUCKER":
+        keep = _douglas_peucker_(xy, offsets, tolerance, levels)
+    elif algorithm == "POINT_REMOVE":
+        keep = _point_remove_(xy, offsets, tolerance)
+    else:
+        raise ValueError("unknown simplification algorithm: " + str(algorithm))
+
+    simplified = _subset_(footprints, vertices=keep)
+    rings = np.diff(simplified['offsets']) >= 3                                                                         # collapsed rings are not buildings anymore
+    if len(rings):
+        rings &= np.abs(_ring_area_(simplified['xy'], simplified['offsets'])) >= minimum_area
+    return _subset_(simplified, rings=rings)
+
+# Douglas-Peucker levels of every vertex, shared by the simplifications at several tolerances
+def simplificationLevels(footprints):                                                                                   # function to run the split hierarchy of _douglas_peucker_ once for all tolerances
+    return _douglas_peucker_levels_(footprints['xy'], footprints['offsets'])
+
+# compare simplifyRings with arcpy SimplifyPolygon_cartography on the same input
+def compareSimplification(inFC, tolerance=1, algorithm="DOUGLAS_PEUCKER"):                                              # function to benchmark the NumPy simplifier against the ArcGIS tool
+    simplifiedFC = "in_memory/compareSimplify"
+    start = time.time()
+    simplifyBuilding(inFC, simplifiedFC, tolerance)
+    reference = readFootprints(simplifiedFC)
+    arcpyTime = time.time() - start
+    arcpy.Delete_management(simplifiedFC)
+
+    start = time.time()
+    footprints = readFootprints(inFC)
+    readTime = time.time() - start
+    start = time.time()
+    simplified = simplifyRings(footprints, tolerance, algorithm=algorithm)
+    numpyTime = time.time() - start
+
+    common, mine, theirs = np.intersect1d(simplified['ids'], reference['ids'], return_indices=True)
+    comparison = dict()
+    comparison['buildings'] = len(footprints['ids'])
+    comparison['arcpy_seconds'] = arcpyTime
+    comparison['read_seconds'] = readTime
+    comparison['numpy_seconds'] = numpyTime
+    comparison['arcpy_vertices'] = len(reference['xy'])
+    comparison['numpy_vertices'] = len(simplified['xy'])
+    comparison['same_vertex_count'] = float(np.mean(np.diff(simplified['offsets'])[mine] == np.diff(reference['offsets'])[theirs])) if len(common) else 0.
+    return comparison
+
+#============ native shapefile backend (no arcpy cursors)
+
+# path of a shapefile sidecar file (.shx, .dbf, .prj, ...)
+def _sibling_(path, ext):                                                                                               # function to swap the extension of a full path, dots in folder names included
+    return os.path.splitext(path)[0] + ext
+
+# gather little-endian values at arbitrary (2 byte aligned) byte positions of a buffer
+def _gather_(buf, positions, dtype):                                                                                    # function to read many values at scattered byte offsets without a per-value loop
+    dtype = np.dtype(dtype)
+    size = dtype.itemsize
+    out = np.empty(len(positions), dtype=dtype)
+    for shift in np.unique(positions % size):                                                                           # one aligned view of the buffer per byte alignment
+        sel = (positions % size) == shift
+        count = (len(buf) - shift) // size
+        view = np.frombuffer(buf, dtype=dtype, count=count, offset=int(shift))
+        out[sel] = view[(positions[sel] - shift) // size]
+    return out
+
+# ragged arange: start .. start + count for every (start, count) pair, concatenated
+def _ranges_(starts, counts):                                                                                           # function to expand ranges into one flat index array
+    counts = np.asarray(counts, dtype=np.int64)
+    shift = np.repeat(np.asarray(starts, dtype=np.int64) - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return shift + np.arange(counts.sum())
+
+# read the record offsets and lengths of the .shx index
+def readShx(path, records=None):                                                                                        # function to read the shapefile index for random record access
+    shx = _sibling_(path, '.shx')
+    count = (os.path.getsize(shx) - 100) // 8                                                                           # 100 byte header, then (offset, length) pairs in 16 bit words
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    index = np.memmap(shx, dtype='>i4', mode='r', offset=100, shape=(count, 2))                                         # only the requested entries are read
+    if records is not None:
+        index = index[records]
+    return np.asarray(index[:, 0], dtype=np.int64) * 2, np.asarray(index[:, 1], dtype=np.int64) * 2
+
+# number of records of a shapefile, from the size of its index
+def countRecords(path):                                                                                                 # function to count buildings without reading them
+    return (os.path.getsize(_sibling_(path, '.shx')) - 100) // 8
+
+# encoding of the text fields of a .dbf, from its .cpg; latin-1 when there is none or it is unknown
+def _dbf_encoding_(path):                                                                                               # function to pick the codec that decodes the attribute text
+    cpg = _sibling_(path, '.cpg')
+    if not os.path.exists(cpg):
+        return 'latin-1'
+    with open(cpg, 'rb') as f:
+        name = f.read().decode('ascii', 'replace').strip().upper().replace('ANSI ', '')
+    name = 'cp' + name if name.isdigit() else name                                                                      # code pages such as 1252
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return 'latin-1'
+
+# numbers stored as text, NaN for the ones that do not parse (empty or overflow markers such as *****)
+def _dbf_numbers_(values, integer):                                                                                     # function to convert a numeric field without failing on broken values
+    try:
+        return np.where(values == b'', b'0' if integer else b'nan', values).astype(np.int64 if integer else np.float64)
+    except ValueError:                                                                                                  # the field becomes float so that NaN can mark the broken values
+        unique, inverse = np.unique(values, return_inverse=True)
+        parsed = np.full(len(unique), np.nan)
+        for ix, value in enumerate(unique.tolist()):                                                                    # one conversion per distinct value
+            try:
+                parsed[ix] = float(value)
+            except ValueError:
+                pass
+        return parsed[inverse]
+
+# read a dBASE table into a NumPy record array
+def readDbf(path, records=None, encoding=None):                                                                         # function to read the attribute table in one bulk read
+    dbf = _sibling_(path, '.dbf')
+    encoding = encoding or _dbf_encoding_(dbf)
+    with open(dbf, 'rb') as f:
+        header = f.read(32)
+        count, headerLength, recordLength = struct.unpack('<IHH', header[4:12])
+        descriptors = f.read(headerLength - 32)
+
+    names, formats, kinds = ['_deleted_'], ['S1'], [('C', 0)]
+    for ix in range(0, len(descriptors) - 1, 32):
+        field = descriptors[ix:ix + 32]
+        if field[:1] == b'\r':                                                                                          # end of the field descriptors
+            break
+        names.append(field[:11].split(b'\0')[0].decode('ascii'))
+        formats.append('S%d' % ord(field[16:17]))
+        kinds.append((field[11:12].decode('ascii'), ord(field[17:18])))
+    dtype = np.dtype({'names': names, 'formats': formats})
+    raw = np.memmap(dbf, dtype=dtype, mode='r', offset=headerLength, shape=(count,)) if count else np.zeros(0, dtype)
+    if records is not None:
+        raw = raw[records]
+
+    columns, dtypes = [], []
+    for name, (kind, decimals) in zip(names[1:], kinds[1:]):
+        values = np.char.strip(np.asarray(raw[name]))
+        if kind in 'NF':                                                                                                # numbers are stored as right aligned text
+            values = _dbf_numbers_(values, decimals == 0 and kind == 'N')
+        elif kind == 'L':
+            values = np.in1d(values, [b'T', b't', b'Y', b'y'])
+        else:
+            values = np.char.decode(values, encoding, 'replace')                                                        # undecodable bytes become U+FFFD instead of failing the read
+        columns.append(values)
+        dtypes.append((str(name), values.dtype))
+    table = np.empty(len(raw), dtype=dtypes)
+    for (name, _), values in zip(dtypes, columns):
+        table[name] = values
+    return table
+
+# read polygon records of a .shp into a flat coordinate buffer with ring offsets
+def readShapefile(path, records=None, attributes=True):                                                                 # function to read buildings without arcpy, optionally only the given record indices
+    """Return footprints (first ring per record) with FIDs, part counts, ring closure, attributes and projection."""
+    shp = _sibling_(path, '.shp')
+    offsets, lengths = readShx(shp, records)                                                                            # random access through the .shx index
+    if isinstance(records, slice):                                                                                      # batches of consecutive records never touch the whole index
+        ids = np.arange(*records.indices(countRecords(shp)), dtype=np.int64)
+    else:
+        ids = np.arange(countRecords(shp), dtype=np.int64)
+        if records is not None:
+            ids = ids[records]
+
+    buf = np.memmap(shp, dtype=np.uint8, mode='r')                                                                      # only the pages of the requested records are read
+    content = offsets + 8
+    shapeType = _gather_(buf, content, '<i4')
+    valid = (shapeType != 0) & (lengths >= 44)                                                                          # null shapes carry no geometry
+    ids, content = ids[valid], content[valid]
+
+    numParts = _gather_(buf, content + 36, '<i4').astype(np.int64)
+    numPoints = _gather_(buf, content + 40, '<i4').astype(np.int64)
+    ringPoints = numPoints.copy()
+    multi = numParts > 1
+    ringPoints[multi] = _gather_(buf, content[multi] + 48, '<i4')                                                       # exterior ring only, the part count is kept in 'parts'
+    pointStart = content + 44 + 4 * numParts
+
+    position = np.repeat(pointStart, 2 * ringPoints) + 8 * _ranges_(np.zeros(len(ringPoints)), 2 * ringPoints)
+    xy = _gather_(buf, position, '<f8').reshape(-1, 2)
+    del buf
+
+    footprints = dict()
+    footprints['xy'], footprints['offsets'], footprints['closed'] = _open_rings_(xy, np.concatenate(([0], np.cumsum(ringPoints))).astype(np.int64))
+    footprints['ids'] = ids
+    footprints['parts'] = numParts
+    if attributes and os.path.exists(_sibling_(shp, '.dbf')):
+        footprints['attributes'] = readDbf(shp, ids)
+    prj = readPrj(shp)
+    if prj is not None:
+        footprints['prj'] = prj
+    return footprints
+
+# projection text of a shapefile, None when there is no .prj
+def readPrj(path):                                                                                                      # function to read the .prj that the native writer copies to the output
+    if not os.path.exists(_sibling_(path, '.prj')):
+        return None
+    with open(_sibling_(path, '.prj')) as f:
+        return f.read()
+
+# closed rings in the winding an output format wants, from the open rings of a flat buffer
+def _closed_rings_(xy, offsets, clockwise=True):                                                                        # function to orient every ring and repeat its first vertex at the end
+    counts = np.diff(offsets)
+    area = _ring_area_(xy, offsets)
+    keep = area <= 0 if clockwise else area >= 0
+    start = np.repeat(offsets[:-1], counts)
+    local = np.arange(len(xy)) - start
+    order = np.where(np.repeat(keep, counts), local, np.repeat(counts, counts) - 1 - local)
+    closedCounts = counts + 1
+    ring = xy[start + order]
+    closing = np.cumsum(closedCounts) - 1
+    points = np.empty((closedCounts.sum(), 2))
+    mask = np.ones(len(points), dtype=bool)
+    mask[closing] = False
+    points[mask] = ring
+    points[closing] = ring[offsets[:-1]]
+    return points, closedCounts
+
+# open a polygon shapefile for buffered batch appends
+def openShapefile(path, fields=(("RIGHT_ID", "N", 10, 0),), prj=None):                                                  # function to create .shp/.shx/.dbf/.prj and return the writer state
+    shp = _sibling_(path, '.shp')
+    writer = dict()
+    writer['shp'] = open(shp, 'wb')
+    writer['shx'] = open(_sibling_(shp, '.shx'), 'wb')
+    writer['dbf'] = open(_sibling_(shp, '.dbf'), 'wb')
+    writer['fields'] = [(name, kind, size, decimals) for name, kind, size, decimals in fields]
+    writer['records'] = 0
+    writer['words'] = 50                                                                                                # file length in 16 bit words, header included
+    writer['bbox'] = np.array([np.inf, np.inf, -np.inf, -np.inf])
+
+    writer['shp'].write(b'\0' * 100)                                                                                    # headers are patched in closeShapefile
+    writer['shx'].write(b'\0' * 100)
+    recordLength = 1 + sum(size for _, _, size, _ in writer['fields'])
+    header = struct.pack('<BBBBIHH20x', 3, 95, 1, 1, 0, 32 * (len(writer['fields']) + 1) + 1, recordLength)
+    for name, kind, size, decimals in writer['fields']:
+        header += struct.pack('<11sc4xBB14x', name.encode('ascii'), kind.encode('ascii'), size, decimals)
+    writer['dbf'].write(header + b'\r')
+
+    if prj:
+        with open(_sibling_(shp, '.prj'), 'w') as f:
+            f.write(prj)
+    with open(_sibling_(shp, '.cpg'), 'w') as f:
+        f.write('UTF-8')
+    return writer
+
+# append a batch of footprints as polygon records in one buffered write per file
+def appendShapefile(writer, footprints, attributes=None):                                                               # function to encode and write a whole batch of buildings
+    xy, offsets = footprints['xy'], footprints['offsets']
+    counts = np.diff(offsets)
+    buildings = len(counts)
+    if buildings == 0:
+        return
+
+    points, closedCounts = _closed_rings_(xy, offsets)                                                                  # shapefile exterior rings are clockwise and closed
+    pointStarts = np.concatenate(([0], np.cumsum(closedCounts)[:-1]))
+
+    # record layout: 8 byte header + type, bbox, numParts, numPoints, one part index, points
+    contentBytes = 48 + 16 * closedCounts
+    recordStart = np.concatenate(([0], np.cumsum(8 + contentBytes)[:-1]))
+    out = np.zeros(int((8 + contentBytes).sum()), dtype=np.uint8)
+
+    lows = np.minimum.reduceat(points, pointStarts, axis=0)
+    highs = np.maximum.reduceat(points, pointStarts, axis=0)
+    ints = out.view('<i4')
+    big = out.view('>i4')
+    big[recordStart // 4] = writer['records'] + 1 + np.arange(buildings)                                                # record numbers start at 1
+    big[recordStart // 4 + 1] = contentBytes // 2
+    ints[recordStart // 4 + 2] = 5                                                                                      # polygon
+    bbox = np.column_stack((lows, highs)).astype('<f8').view(np.uint8).reshape(-1, 32)
+    out[(recordStart + 12)[:, None] + np.arange(32)] = bbox
+    ints[recordStart // 4 + 11] = 1
+    ints[recordStart // 4 + 12] = closedCounts
+    ints[recordStart // 4 + 13] = 0
+    pointBytes = points.astype('<f8').view(np.uint8).reshape(-1, 16)
+    pointStart = np.repeat(recordStart + 56, closedCounts) + 16 * _ranges_(np.zeros(buildings), closedCounts)
+    out[pointStart[:, None] + np.arange(16)] = pointBytes
+    writer['shp'].write(out.tobytes())
+
+    index = np.empty((buildings, 2), dtype='>i4')
+    index[:, 0] = writer['words'] + recordStart // 2
+    index[:, 1] = contentBytes // 2
+    writer['shx'].write(index.tobytes())
+
+    table = np.empty(buildings, dtype=[('_deleted_', 'S1')] + [(str(name), 'S%d' % size) for name, _, size, _ in writer['fields']])
+    table['_deleted_'] = b' '
+    if attributes is None:
+        attributes = {"RIGHT_ID": footprints['ids']}
+    for name, kind, size, decimals in writer['fields']:
+        values = np.asarray(attributes[name])
+        if kind in 'NF':
+            text = np.char.mod('%' + str(size) + '.' + str(decimals) + 'f', values.astype(np.float64))
+        else:
+            text = np.char.ljust(values.astype('U'), size)
+        table[str(name)] = np.char.encode(text, 'utf-8')
+    writer['dbf'].write(table.tobytes())
+
+    writer['records'] += buildings
+    writer['words'] += int(len(out) // 2)
+    writer['bbox'] = np.concatenate((np.minimum(writer['bbox'][:2], lows.min(axis=0)), np.maximum(writer['bbox'][2:], highs.max(axis=0))))
+
+# patch the file headers and close a shapefile opened by openShapefile
+def closeShapefile(writer):                                                                                             # function to finish the .shp/.shx/.dbf headers
+    bbox = writer['bbox'] if writer['records'] else np.zeros(4)
+    for key, words in (('shp', writer['words']), ('shx', 50 + 4 * writer['records'])):
+        header = struct.pack('>7i', 9994, 0, 0, 0, 0, 0, words) + struct.pack('<2i4d32x', 1000, 5, *bbox.tolist())
+        writer[key].seek(0)
+        writer[key].write(header)
+        writer[key].close()
+
+    writer['dbf'].write(b'\x1a')                                                                                        # end of file marker
+    today = time.localtime()
+    writer['dbf'].seek(1)
+    writer['dbf'].write(struct.pack('<BBBI', today.tm_year - 1900, today.tm_mon, today.tm_mday, writer['records']))
+    writer['dbf'].close()
+
+# write footprints to a polygon shapefile in a single buffered pass
+def writeShapefile(path, footprints, prj=None, fields=(("RIGHT_ID", "N", 10, 0),), attributes=None):                    # function to write buildings without arcpy
+    writer = openShapefile(path, fields, prj)
+    appendShapefile(writer, footprints, attributes)
+    closeShapefile(writer)
+
+# flat footprints from a (N, 4, 2) corner array
+def _corner_footprints_(corners, ids):                                                                                  # function to turn regularized rectangles back into the flat buffer layout
+    footprints = dict()
+    footprints['xy'] = corners.reshape(-1, 2)
+    footprints['offsets'] = np.arange(0, 4 * len(corners) + 1, 4, dtype=np.int64)
+    footprints['ids'] = ids
+    return footprints
+
+#============ output sinks and background writer
+
+# scatter little-endian values to arbitrary byte positions of a buffer, the counterpart of _gather_
+def _scatter_(out, positions, values, dtype):                                                                           # function to write many values at scattered byte offsets without a per-value loop
+    data = np.ascontiguousarray(values, dtype=dtype).view(np.uint8).reshape(len(positions), -1)
+    out[np.asarray(positions)[:, None] + np.arange(data.shape[1])] = data
+
+# GeoJSON Lines: one Feature per line, counterclockwise closed rings in the input projection (projected, so not RFC 7946, which requires WGS84)
+def openGeoJsonLines(path, prj=None):                                                                                   # function to create a .geojsonl output and return the writer state
+    writer = dict(file=open(path, 'w'), records=0)
+    if prj:                                                                                                             # readers that expect RFC 7946 ignore it and take the coordinates for longitude and latitude
+        with open(_sibling_(path, '.prj'), 'w') as f:
+            f.write(prj)
+    return writer
+
+# append a batch of footprints as GeoJSON features
+def appendGeoJsonLines(writer, footprints):                                                                             # function to encode and write a whole batch of buildings, one line each
+    if len(footprints['ids']) == 0:
+        return
+    points, closedCounts = _closed_rings_(footprints['xy'], footprints['offsets'], clockwise=False)
+    coordinates = ['[%r,%r]' % point for point in map(tuple, points.tolist())]                                          # repr keeps every double exact
+    ends = np.cumsum(closedCounts).tolist()
+    lines = []
+    for start, end, identifier in zip([0] + ends[:-1], ends, footprints['ids'].tolist()):
+        lines.append('{"type":"Feature","id":%d,"properties":{"RIGHT_ID":%d},"geometry":{"type":"Polygon","coordinates":[[%s]]}}\n'
+                     % (identifier, identifier, ",".join(coordinates[start:end])))
+    writer['file'].write("".join(lines))
+    writer['records'] += len(lines)
+
+# close a GeoJSON Lines output
+def closeGeoJsonLines(writer):                                                                                          # function to flush and close the .geojsonl file
+    writer['file'].close()
+
+_GPKG_WGS84_ = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],'
+                'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]')
+_GPKG_SRS_ID_ = 100000                                                                                                  # srs_id of the input projection, which a .prj does not number
+
+# GeoPackage through the standard library sqlite3: the required tables and one polygon layer named after the file
+def openGeoPackage(path, prj=None):                                                                                     # function to create a .gpkg output and return the writer state
+    import sqlite3
+    if os.path.exists(path):
+        os.remove(path)
+    layer = os.path.splitext(os.path.basename(path))[0]
+    srs = _GPKG_SRS_ID_ if prj else -1                                                                                  # -1 is the undefined cartesian system of the specification
+    database = sqlite3.connect(path, check_same_thread=False)                                                           # the background writer appends from its own thread
+    database.executescript('''
+        PRAGMA application_id = 1196444487;
+        PRAGMA user_version = 10200;
+        CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL,
+            organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+        CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT '',
+            last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+            srs_id INTEGER, CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id));
+        CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL,
+            z TINYINT NOT NULL, m TINYINT NOT NULL, CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+            CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+            CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id));
+    ''')
+    systems = [("WGS 84 geodetic", 4326, "EPSG", 4326, _GPKG_WGS84_), ("Undefined cartesian SRS", -1, "NONE", -1, "undefined"),
+               ("Undefined geographic SRS", 0, "NONE", 0, "undefined")]
+    if prj:
+        systems.append((prj.split('"')[1] if '"' in prj else layer, srs, "NONE", srs, prj))
+    database.executemany("INSERT INTO gpkg_spatial_ref_sys (srs_name, srs_id, organization, organization_coordsys_id, definition) VALUES (?, ?, ?, ?, ?)", systems)
+    database.execute('CREATE TABLE "%s" (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, geom POLYGON, RIGHT_ID INTEGER)' % layer)
+    database.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, ?)", (layer, layer, srs))
+    database.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 'POLYGON', ?, 0, 0)", (layer, srs))
+    database.commit()
+    return dict(database=database, layer=layer, srs=srs, records=0, bbox=np.array([np.inf, np.inf, -np.inf, -np.inf]))
+
+# append a batch of footprints as GeoPackage geometry blobs (header, envelope, little-endian WKB polygon) in one transaction
+def appendGeoPackage(writer, footprints):                                                                               # function to encode a whole batch of buildings into blobs and insert them
+    buildings = len(footprints['offsets']) - 1
+    if buildings == 0:
+        return
+    points, closedCounts = _closed_rings_(footprints['xy'], footprints['offsets'], clockwise=False)
+    pointStarts = np.concatenate(([0], np.cumsum(closedCounts)[:-1]))
+    lows, highs = np.minimum.reduceat(points, pointStarts, axis=0), np.maximum.reduceat(points, pointStarts, axis=0)
+
+    sizes = 53 + 16 * closedCounts
+    blobStart = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    _scatter_(out, blobStart, np.tile(np.array([71, 80, 0, 3], dtype=np.uint8), (buildings, 1)), np.uint8)              # "GP", version 0, little endian with an xy envelope
+    _scatter_(out, blobStart + 4, np.repeat(writer['srs'], buildings), '<i4')
+    _scatter_(out, blobStart + 8, np.column_stack((lows[:, 0], highs[:, 0], lows[:, 1], highs[:, 1])), '<f8')
+    out[blobStart + 40] = 1
+    _scatter_(out, blobStart + 41, np.column_stack((np.repeat(3, buildings), np.ones(buildings), closedCounts)), '<u4') # polygon, one ring, its points
+    _scatter_(out, np.repeat(blobStart + 53, closedCounts) + 16 * _ranges_(np.zeros(buildings), closedCounts), points, '<f8')
+
+    data = out.tobytes()
+    ends = (blobStart + sizes).tolist()
+    rows = [(data[start:end], identifier) for start, end, identifier in zip(blobStart.tolist(), ends, footprints['ids'].tolist())]
+    with writer['database']:                                                                                            # one transaction per batch
+        writer['database'].executemany('INSERT INTO "%s" (geom, RIGHT_ID) VALUES (?, ?)' % writer['layer'], rows)
+    writer['records'] += buildings
+    writer['bbox'] = np.concatenate((np.minimum(writer['bbox'][:2], lows.min(axis=0)), np.maximum(writer['bbox'][2:], highs.max(axis=0))))
+
+# store the layer extent and close a GeoPackage
+def closeGeoPackage(writer):                                                                                            # function to finish gpkg_contents and close the database
+    if writer['records']:
+        with writer['database']:
+            writer['database'].execute("UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? WHERE table_name = ?",
+                                       tuple(writer['bbox'].tolist()) + (writer['layer'],))
+    writer['database'].close()
+
+_SINKS_ = {'.shp': (openShapefile, appendShapefile, closeShapefile), '.geojsonl': (openGeoJsonLines, appendGeoJsonLines, closeGeoJsonLines),
+           '.gpkg': (openGeoPackage, appendGeoPackage, closeGeoPackage)}                                                # output formats by extension
+
+# the open, append and close functions of the output format named by the extension of path
+def _output_sink_(path):                                                                                                # function to pick the writer of an output path, or refuse it before any work
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _SINKS_:
+        raise ValueError("unsupported output format %r, expected one of %s" % (extension, ", ".join(sorted(_SINKS_))))
+    return _SINKS_[extension]
+
+# open an output by its extension; with queueSize > 0 a background thread writes while the next batch is computed
+def openOutput(path, prj=None, queueSize=0):                                                                            # function to open a shapefile, GeoJSON Lines or GeoPackage output for batch appends
+    """Return the writer state of a .shp, .geojsonl or .gpkg output, threaded when queueSize > 0."""
+    sink = _output_sink_(path)
+    writer = dict(path=path, sink=sink, state=sink[0](path, prj=prj), records=0, error=None)
+    if queueSize > 0:
+        writer['queue'] = queue.Queue(queueSize)
+        writer['thread'] = threading.Thread(target=_write_queue_, args=(writer,), name="orthogonality-writer")
+        writer['thread'].daemon = True
+        writer['thread'].start()
+    return writer
+
+# encode and write one batch in the calling thread
+def _write_batch_(writer, footprints):                                                                                  # function shared by synchronous appends and the background writer
+    with stage("write") as record:
+        writer['sink'][1](writer['state'], footprints)
+        record.update(_sizes_(footprints))
+    writer['records'] += len(footprints['offsets']) - 1
+
+# background writer loop: after an error it keeps draining the queue so that the producer never blocks
+def _write_queue_(writer):                                                                                              # function run by the writer thread until closeOutput queues None
+    while True:
+        footprints = writer['queue'].get()
+        if footprints is None:
+            return
+        if writer['error'] is None:
+            try:
+                _write_batch_(writer, footprints)
+            except Exception as error:
+                writer['error'] = error
+
+# write one batch, or queue it for the background writer
+def appendOutput(writer, footprints):                                                                                   # function to append a batch of footprints to an output of openOutput
+    if writer['error'] is not None:
+        raise writer['error']
+    if 'queue' in writer:
+        writer['queue'].put(footprints)                                                                                 # blocks while queueSize batches are waiting
+    else:
+        _write_batch_(writer, footprints)
+
+# wait for the background writer and finish the output
+def closeOutput(writer):                                                                                                # function to close an output of openOutput, returns the number of buildings written
+    if 'queue' in writer:
+        writer['queue'].put(None)
+        writer['thread'].join()
+    writer['sink'][2](writer['state'])
+    if writer['error'] is not None:
+        raise writer['error']
+    return writer['records']
+
+# write footprints to any supported output in one call
+def writeOutput(path, footprints, prj=None):                                                                            # function to write buildings to a .shp, .geojsonl or .gpkg file
+    writer = openOutput(path, prj)
+    appendOutput(writer, footprints)
+    return closeOutput(writer)
+
+#============ fused edge summary
+
+_SUMMARY_KEYS_ = ('lengths', 'azimuths', 'angles', 'max_index', 'min_index', 'max_length', 'min_length')                # keys added by edgeSummary
+
+# lengths, azimuths, angles and longest/shortest edge of every building, built in one pass
+def edgeSummary(footprints):                                                                                            # function to compute every per-edge and per-building measure consumed downstream
+    """Return a copy of the footprints with the edge summary added."""
+    xy, offsets = footprints['xy'], footprints['offsets']
+    counts = np.diff(offsets)
+    prv, nxt = _neighbours_(offsets)
+    edges = xy[nxt] - xy
+
+    summary = dict(footprints)
+    summary['lengths'] = np.sqrt(np.einsum('ij,ij->i', edges, edges))
+    summary['azimuths'] = np.arctan2(edges[:, 1], edges[:, 0])
+    summary['angles'] = _vertex_angles_(edges[prv], -edges)
+
+    if len(counts):
+        ring = np.repeat(np.arange(len(counts)), counts)
+        longest, maxLength = _group_argmax_(summary['lengths'], ring, offsets[:-1])
+        shortest, minLength = _group_argmax_(-summary['lengths'], ring, offsets[:-1])
+    else:
+        longest = maxLength = shortest = minLength = np.zeros(0)
+    summary['max_index'] = (longest - offsets[:-1]).astype(np.int64)
+    summary['min_index'] = (shortest - offsets[:-1]).astype(np.int64)
+    summary['max_length'] = maxLength
+    summary['min_length'] = -minLength
+    return summary
+
+# edge summary of the split segments of a feature class, read in a single scan
+def geomEdgeSummary(inFC):                                                                                              # function to replace the geomCoords rescans of geoMaxLength, geoMinLength and geomLength
+    corners = geomCorners(inFC)
+    return edgeSummary(_corner_footprints_(corners, np.arange(len(corners))))
+
+#============ columnar store (memory-mappable segment attributes)
+
+COLUMNS_VERSION = 1                                                                                                     # layout version written to columns.json
+
+# create a columnar store: one raw little-endian file per column plus the columns.json index
+def openColumns(path):                                                                                                  # function to start a store that appendColumns fills batch by batch
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    elif os.path.exists(os.path.join(path, 'columns.json')):
+        for name in os.listdir(path):                                                                                   # an older (or unfinished) store at the same place is replaced
+            if name.endswith('.bin'):
+                os.remove(os.path.join(path, name))
+    elif os.listdir(path):
+        raise ValueError("%s is not empty and holds no columnar store" % path)
+    with open(os.path.join(path, 'columns.json'), 'w') as index:
+        json.dump(dict(version=None), index)                                                                            # claims the directory until closeColumns writes the real index
+    store = dict(path=path, buildings=0, vertices=0, columns=dict(), files=dict())
+    store['files']['offsets'] = open(os.path.join(path, 'offsets.bin'), 'wb')
+    return store
+
+# append one batch: coordinates, ids and the attribute arrays, each declared per 'vertex' or per 'building' in scopes
+def appendColumns(store, footprints, columns=None, scopes=None):                                                        # function to write a batch column by column, no per-row work
+    buildings, vertices = len(footprints['offsets']) - 1, len(footprints['xy'])
+    arrays = dict(xy=footprints['xy'], ids=footprints['ids'])
+    arrays.update(columns or dict())
+    scopes = dict(scopes or dict(), xy='vertex', ids='building')
+    for name, value in arrays.items():
+        value = np.asarray(value)
+        if name not in store['files']:
+            if store['buildings']:
+                raise ValueError("column %s is missing from the earlier batches" % name)
+            if scopes.get(name) not in ('vertex', 'building'):
+                raise ValueError("column %s has no 'vertex' or 'building' scope" % name)
+            store['columns'][name] = dict(dtype=value.dtype.newbyteorder('<').str, shape=list(value.shape[1:]), scope=scopes[name])
+            store['files'][name] = open(os.path.join(store['path'], name + '.bin'), 'wb')
+        if len(value) != (vertices if store['columns'][name]['scope'] == 'vertex' else buildings):
+            raise ValueError("column %s has %d rows for %d buildings and %d vertices" % (name, len(value), buildings, vertices))
+        dtype = np.dtype(str(store['columns'][name]['dtype']))
+        store['files'][name].write(np.ascontiguousarray(value, dtype=dtype).tobytes())
+    starts = footprints['offsets'][:-1] + store['vertices']                                                             # ring offsets continue across batches
+    store['files']['offsets'].write(np.asarray(starts, dtype='<i8').tobytes())
+    store['buildings'] += buildings
+    store['vertices'] += vertices
+
+# finish the ring-offset index and write columns.json, which marks the store complete
+def closeColumns(store, **meta):                                                                                        # function to close the column files; meta (JSON-able) is kept in columns.json
+    store['files']['offsets'].write(np.array([store['vertices']], dtype='<i8').tobytes())
+    for column in store['files'].values():
+        column.close()
+    columns = dict(store['columns'])
+    columns['offsets'] = dict(dtype='<i8', shape=[], scope='index')
+    info = dict(version=COLUMNS_VERSION, buildings=store['buildings'], vertices=store['vertices'], columns=columns, meta=meta)
+    with open(os.path.join(store['path'], 'columns.json'), 'w') as index:
+        json.dump(info, index, indent=2, sort_keys=True)
+    return info
+
+# whole store in one call
+def writeColumns(path, footprints, columns=None, scopes=None, **meta):                                                  # function to write buildings and their attributes as a columnar store
+    store = openColumns(path)
+    appendColumns(store, footprints, columns, scopes)
+    return closeColumns(store, **meta)
+
+# open a columnar store: every column is a read-only memory map, nothing is copied
+def readColumns(path, columns=None):                                                                                    # function to load a store as a footprint dict; columns limits the attributes mapped
+    with open(os.path.join(path, 'columns.json')) as index:
+        info = json.load(index)
+    if info['version'] != COLUMNS_VERSION:
+        raise ValueError("unsupported or unfinished columnar store version %s" % info['version'])
+    rows = dict(vertex=info['vertices'], building=info['buildings'], index=info['buildings'] + 1)
+    store = dict(meta=info['meta'])
+    for name, column in info['columns'].items():
+        if columns is not None and name not in columns and name not in ('xy', 'offsets', 'ids'):
+            continue
+        shape, dtype = (rows[column['scope']],) + tuple(column['shape']), np.dtype(str(column['dtype']))
+        if shape[0] == 0:
+            store[name] = np.zeros(shape, dtype=dtype)                                                                  # empty files cannot be mapped
+        else:
+            store[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode='r', shape=shape)
+    return store
+
+SEGMENT_SCOPES = dict(angles='vertex', angle_errors='vertex', lengths='vertex', azimuths='vertex', max_index='building', min_index='building',
+                      max_length='building', min_length='building', status='building', residuals='building', max_residuals='building',
+                      area_change='building')                                                                           # scope of every column segmentColumns may return
+
+# the per-segment and per-building attributes of an edge summary, once written to the Angle, Angle_Err and Length fields
+def segmentColumns(summary):                                                                                            # function to pick the attribute columns of a summarized (and possibly classified) buffer
+    columns = dict()
+    columns['angles'] = summary['angles']
+    columns['angle_errors'] = 90 - summary['angles']
+    columns['lengths'] = summary['lengths']
+    columns['azimuths'] = summary['azimuths']
+    for key in ('max_index', 'min_index', 'max_length', 'min_length', 'status', 'residuals', 'max_residuals', 'area_change'):
+        if key in summary:
+            columns[key] = summary[key]
+    return columns
+
+# identity of an input file, so that a store can tell whether it is still current
+def _source_(inFC, **parameters):                                                                                       # function to describe an input by path, size, modification time and parameters
+    source = dict(parameters, input=os.path.abspath(inFC), size=None, modified=None)
+    if os.path.isfile(inFC):
+        source['size'], source['modified'] = os.path.getsize(inFC), os.path.getmtime(inFC)
+    return source
+
+# whether a store was written from the current version of an input
+def _columns_current_(path, source):                                                                                    # function to let repeat runs skip the stages that produced the store
+    if source.get('modified') is None or not os.path.exists(os.path.join(path, 'columns.json')):
+        return False
+    with open(os.path.join(path, 'columns.json')) as index:
+        info = json.load(index)
+    return info.get('version') == COLUMNS_VERSION and info.get('meta') == source
+
+#============ orthogonal polygons (L, T, U shapes and beyond)
+
+# concatenate batches of footprints and restore the feature id order
+def _merge_footprints_(parts):                                                                                          # function to merge regularized pieces back into one flat buffer
+    parts = [p for p in parts if len(p['ids'])]
+    if not parts:
+        return dict(xy=np.zeros((0, 2)), offsets=np.zeros(1, dtype=np.int64), ids=np.zeros(0, dtype=np.int64))
+    ids = np.concatenate([p['ids'] for p in parts])
+    counts = np.concatenate([np.diff(p['offsets']) for p in parts])
+    xy = np.concatenate([p['xy'] for p in parts])
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    restore = np.argsort(ids, kind='mergesort')
+    merged = dict()
+    merged['xy'] = xy[_ranges_(offsets[:-1][restore], counts[restore])]
+    merged['offsets'] = np.concatenate(([0], np.cumsum(counts[restore]))).astype(np.int64)
+    merged['ids'] = ids[restore]
+    return merged
+
+# azimuth of the longest edge of every building, the reference direction of bringAllTogether
+def longestEdgeOrientation(footprints):                                                                                 # function to get the reference azimuth (radians) per building
+    if 'max_index' not in footprints:
+        footprints = edgeSummary(footprints)
+    return footprints['azimuths'][footprints['offsets'][:-1] + footprints['max_index']]
+
+# edge azimuths folded into [0, 90) degrees with their lengths, the input of every orientation estimator
+def _edge_directions_(footprints):                                                                                      # function to compute the folded azimuth (radians) and length of every edge
+    if 'azimuths' not in footprints:
+        footprints = edgeSummary(footprints)
+    return footprints['azimuths'] % (np.pi / 2.), footprints['lengths']
+
+# length-weighted circular mean of the edge azimuths modulo 90 degrees
+def _circular_orientation_(folded, weights, offsets):                                                                   # function to average directions on the 4-fold circle
+    c = np.add.reduceat(weights * np.cos(4. * folded), offsets[:-1])
+    s = np.add.reduceat(weights * np.sin(4. * folded), offsets[:-1])
+    return (np.arctan2(s, c) / 4.) % (np.pi / 2.)
+
+# robust building orientation from all edges instead of the longest one
+def dominantOrientation(footprints, method="histogram", bins=36, window=20.):                                           # function to estimate the orientation (radians, modulo 90 degrees) of every building
+    """Return one orientation per building in [0, pi/2)."""
+    offsets = footprints['offsets']
+    counts = np.diff(offsets)
+    if len(counts) == 0:
+        return np.zeros(0)
+    if 'azimuths' not in footprints:
+        footprints = edgeSummary(footprints)
+    folded, lengths = _edge_directions_(footprints)
+    if method == "longest":
+        return longestEdgeOrientation(footprints) % (np.pi / 2.)
+    if method == "circular":
+        return _circular_orientation_(folded, lengths, offsets)
+    if method != "histogram":
+        raise ValueError("unknown orientation method: " + str(method))
+
+    width = (np.pi / 2.) / bins
+    ring = np.repeat(np.arange(len(counts)), counts)
+    binIndex = np.minimum((folded / width).astype(np.int64), bins - 1)
+
+    # sparse (building, bin) histogram: only occupied bins are stored, smoothed with both neighbour bins
+    keys = np.concatenate([ring * bins + (binIndex + shift) % bins for shift in (-1, 0, 1)])
+    keyWeights = np.tile(lengths, 3)
+    occupied, inverse = np.unique(keys, return_inverse=True)
+    votes = np.bincount(inverse, keyWeights)
+    owner = occupied // bins
+    ownerStarts = np.searchsorted(owner, np.arange(len(counts)))
+    peak, _ = _group_argmax_(votes, owner, ownerStarts)
+    centre = ((occupied[peak] % bins) + 0.5) * width
+
+    distance = np.abs((folded - centre[ring] + np.pi / 4.) % (np.pi / 2.) - np.pi / 4.)
+    inside = np.where(distance <= max(1.5 * width, np.radians(window)), lengths, 0.) + 1e-12                            # edges of the winning window only
+    return _circular_orientation_(folded, inside, offsets)
+
+# compare orientation estimators by the length-weighted angular misfit of the edges (and the truth when known)
+def compareOrientation(footprints, truth=None, methods=("longest", "circular", "histogram")):                           # function to measure the accuracy of the orientation estimators
+    folded, lengths = _edge_directions_(footprints)
+    offsets = footprints['offsets']
+    ring = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    comparison = dict()
+    for method in methods:
+        orientation = dominantOrientation(footprints, method)
+        misfit = np.abs((folded - orientation[ring] + np.pi / 4.) % (np.pi / 2.) - np.pi / 4.)
+        summary = dict()
+        summary['weighted_rms_degrees'] = float(np.degrees(np.sqrt(np.sum(lengths * misfit ** 2) / np.sum(lengths))))
+        if truth is not None:
+            error = np.abs((orientation - truth + np.pi / 4.) % (np.pi / 2.) - np.pi / 4.)
+            summary['mean_error_degrees'] = float(np.degrees(error.mean()))
+            summary['max_error_degrees'] = float(np.degrees(error.max()))
+        comparison[method] = summary
+    return comparison
+
+# snap every edge of every ring to the building orientation or its perpendicular
+def regularizeRings(footprints, epsilon=15., orientation=None, shared=None):                                            # function to regularize N-vertex orthogonal buildings in O(total vertices)
+    """Return regularized footprints and a mask of the buildings that were snapped."""
+    xy, offsets, ids = footprints['xy'], footprints['offsets'], footprints['ids']
+    counts = np.diff(offsets)
+    buildings = len(counts)
+    if buildings == 0:
+        return _subset_(footprints), np.zeros(0, dtype=bool)
+    if orientation is None:
+        orientation = longestEdgeOrientation(footprints)
+
+    ring = np.repeat(np.arange(buildings), counts)
+    prv, nxt = _neighbours_(offsets)
+    cos, sin = np.cos(orientation)[ring], np.sin(orientation)[ring]
+    origin = xy[offsets[:-1]][ring]                                                                                     # local frame per building keeps UTM coordinates precise
+    local = xy - origin
+    u = local[:, 0] * cos + local[:, 1] * sin                                                                           # coordinates in the building frame, u along the orientation
+    v = local[:, 1] * cos - local[:, 0] * sin
+
+    du, dv = u[nxt] - u, v[nxt] - v
+    lengths = np.sqrt(du * du + dv * dv)
+    turn = np.arctan2(dv, du)
+    quarter = np.round(turn / (np.pi / 2.))
+    deviation = np.degrees(np.abs(turn - quarter * (np.pi / 2.)))                                                       # angle to the nearest axis of the building frame
+    along = (quarter.astype(np.int64) % 2) == 0                                                                         # True for walls parallel to u (constant v)
+
+    snapped = np.logical_and.reduceat(deviation <= epsilon, offsets[:-1])
+
+    # runs of consecutive parallel edges become one wall; the first run wraps around the ring end
+    change = along != along[prv]
+    runs = np.add.reduceat(change.astype(np.int64), offsets[:-1])
+    snapped &= (runs >= 4) & (counts >= 4)
+
+    changeCount = np.cumsum(change) - np.repeat(np.cumsum(change)[offsets[:-1]] - change[offsets[:-1]], counts)
+    runStarts = np.concatenate(([0], np.cumsum(runs)[:-1]))
+    label = np.repeat(runStarts, counts) + (changeCount - 1) % np.maximum(np.repeat(runs, counts), 1)
+
+    weights = np.where(np.repeat(runs > 0, counts), lengths + 1e-12, 0.)                                                # zero-length edges must not empty a wall, single-direction rings add nothing
+    midpoint = np.where(along, (v + v[nxt]) / 2., (u + u[nxt]) / 2.)
+    totalRuns = int(runs.sum())
+    wall = np.bincount(label, weights * midpoint, minlength=totalRuns) / np.maximum(np.bincount(label, weights, minlength=totalRuns), 1e-300)
+    if shared is not None and len(shared):
+        wall = _shared_walls_(wall, label, along, weights, origin, orientation[ring], shared, snapped[ring])
+
+    # a wall starts at a changed edge; its first vertex is the corner with the previous wall
+    start = np.flatnonzero(change)
+    runRing = ring[start]
+    order = np.argsort(label[start], kind='mergesort')
+    start, runRing = start[order], runRing[order]
+    current = label[start]
+    previous = np.where(current == runStarts[runRing], current + runs[runRing] - 1, current - 1)
+    cu = np.where(along[start], wall[previous], wall[current])
+    cv = np.where(along[start], wall[current], wall[previous])
+
+    rcos, rsin = np.cos(orientation)[runRing], np.sin(orientation)[runRing]
+    corners = np.column_stack((cu * rcos - cv * rsin, cu * rsin + cv * rcos)) + xy[offsets[:-1]][runRing]
+
+    keepCorner = snapped[runRing]
+    fixedCounts = np.where(snapped, runs, counts)
+    fixed = dict()
+    fixed['xy'] = np.empty((int(fixedCounts.sum()), 2))
+    fixed['offsets'] = np.concatenate(([0], np.cumsum(fixedCounts))).astype(np.int64)
+    fixed['ids'] = ids
+    fixedRing = np.repeat(np.arange(buildings), fixedCounts)
+    fixed['xy'][snapped[fixedRing]] = corners[keepCorner]
+    fixed['xy'][~snapped[fixedRing]] = xy[~snapped[ring]]
+    return fixed, snapped
+
+# regularize every building around its dominant orientation ("longest" is the reference direction of bringAllTogether)
+def regularizeBuildings(footprints, epsilon=15., orientation="histogram", fit=None):                                    # function to regularize a flat buffer of buildings of any vertex count
+    if fit is not None:                                                                                                 # four-corner buildings become their fitted rectangle, see fitRectangles
+        counts = np.diff(footprints['offsets'])
+        rectangles = fitRectangles(_subset_(footprints, rings=counts == 4), fit, orientation)
+        others = regularizeBuildings(_subset_(footprints, rings=counts != 4), epsilon, orientation)
+        fixed = _merge_footprints_([rectangles, others])
+        for key in ('residuals', 'max_residuals', 'area_change'):
+            fixed[key] = np.full(len(fixed['ids']), np.nan)                                                             # not a fit for the other buildings
+            fixed[key][np.searchsorted(fixed['ids'], rectangles['ids'])] = rectangles[key]
+        fixed['snapped'] = np.ones(len(fixed['ids']), dtype=bool)                                                       # a fitted rectangle is always orthogonal
+        fixed['snapped'][np.searchsorted(fixed['ids'], others['ids'])] = others['snapped']
+        return fixed
+    fixed, fixed['snapped'] = regularizeRings(footprints, epsilon, dominantOrientation(footprints, orientation))        # rectangles too: regularizeCorners only suits clockwise rings with positive coordinates
+    return fixed
+
+# fixable buildings with an edge beyond epsilon of the building orientation come back unsnapped: they are out of tolerance after all
+def _unsnapped_(status, ids, fixed):                                                                                    # function to reclassify them and drop them from the regularized buildings
+    missed = np.isin(ids, fixed['ids'][~fixed['snapped']]) & (status == FIXABLE)
+    status = status.copy()
+    status[missed] = OUT_OF_TOLERANCE
+    return status, _subset_(fixed, rings=~np.isin(fixed['ids'], ids[missed]))
+
+#============ rectangle fitting (least squares and minimum area)
+
+# orientation and extent of the smallest rectangle around every ring, one candidate direction per edge
+def _minimum_area_frame_(local, offsets):                                                                               # function to run the rotating-calipers search over the edge directions of all rings at once
+    counts = np.diff(offsets)
+    ring = np.repeat(np.arange(len(counts)), counts)
+    _, nxt = _neighbours_(offsets)
+    direction = np.arctan2(local[nxt, 1] - local[:, 1], local[nxt, 0] - local[:, 0]) % (np.pi / 2.)
+
+    # every edge of a ring against every vertex of the same ring: sum of squared vertex counts in all
+    size = counts[ring]
+    vertex = _ranges_(offsets[:-1][ring], size)
+    candidate = np.repeat(np.arange(len(local)), size)
+    cos, sin = np.cos(direction)[candidate], np.sin(direction)[candidate]
+    u = local[vertex, 0] * cos + local[vertex, 1] * sin
+    v = local[vertex, 1] * cos - local[vertex, 0] * sin
+    starts = np.concatenate(([0], np.cumsum(size)[:-1]))
+    low = np.column_stack((np.minimum.reduceat(u, starts), np.minimum.reduceat(v, starts)))
+    high = np.column_stack((np.maximum.reduceat(u, starts), np.maximum.reduceat(v, starts)))
+    area = np.prod(high - low, axis=1)
+
+    smallest = np.minimum.reduceat(area, offsets[:-1])
+    hits = np.flatnonzero(area <= smallest[ring] * (1. + 1e-9))                                                         # near ties go to the first edge, the same on every platform
+    _, first = np.unique(ring[hits], return_index=True)
+    best = hits[first]
+    return direction[best], low[best], high[best]
+
+# closed-form least-squares walls at a given orientation: every edge votes for the nearest parallel side
+def _least_squares_frame_(local, offsets, orientation):                                                                 # function to place the four sides of every rectangle at the length-weighted mean of their edges
+    counts = np.diff(offsets)
+    buildings = len(counts)
+    ring = np.repeat(np.arange(buildings), counts)
+    _, nxt = _neighbours_(offsets)
+    cos, sin = np.cos(orientation)[ring], np.sin(orientation)[ring]
+    u = local[:, 0] * cos + local[:, 1] * sin
+    v = local[:, 1] * cos - local[:, 0] * sin
+    low = np.column_stack((np.minimum.reduceat(u, offsets[:-1]), np.minimum.reduceat(v, offsets[:-1])))
+    high = np.column_stack((np.maximum.reduceat(u, offsets[:-1]), np.maximum.reduceat(v, offsets[:-1])))
+    centre = (low + high) / 2.
+
+    du, dv = u[nxt] - u, v[nxt] - v
+    lengths = np.sqrt(du * du + dv * dv)
+    along = np.abs(du) >= np.abs(dv)                                                                                    # edges closer to the u axis fit the v = constant sides
+    midpoint = np.where(along, (v + v[nxt]) / 2., (u + u[nxt]) / 2.)
+    upper = midpoint > np.where(along, centre[ring, 1], centre[ring, 0])
+    side = ring * 4 + np.where(along, 2, 0) + upper                                                                     # 0 low u, 1 high u, 2 low v, 3 high v
+
+    # the mean of a segment's perpendicular offsets is its midpoint, so each side is a weighted mean of midpoints
+    weight = np.bincount(side, lengths, minlength=4 * buildings)
+    wall = np.bincount(side, lengths * midpoint, minlength=4 * buildings) / np.maximum(weight, 1e-300)
+    extent = np.column_stack((low[:, 0], high[:, 0], low[:, 1], high[:, 1])).ravel()
+    wall = np.where(weight > 0, wall, extent).reshape(-1, 4)                                                            # a side without edges falls back to the extent
+    return np.column_stack((wall[:, 0], wall[:, 2])), np.column_stack((wall[:, 1], wall[:, 3]))
+
+# distance from points to the outline of an axis-aligned rectangle, inside or outside
+def _rectangle_distance_(points, low, high):                                                                            # function to measure how far every input vertex is from its fitted rectangle
+    outside = np.maximum(np.maximum(low - points, points - high), 0.)
+    inside = np.minimum(points - low, high - points).min(axis=1)
+    return np.where((outside > 0).any(axis=1), np.sqrt((outside ** 2).sum(axis=1)), inside)
+
+# best rectangle for every ring, with its residuals and area change
+def fitRectangles(footprints, method="least_squares", orientation="histogram"):                                         # function to replace every ring by its fitted rectangle in closed form
+    """Return 4-corner footprints with 'residuals', 'max_residuals' and 'area_change'."""
+    xy, offsets = footprints['xy'], footprints['offsets']
+    counts = np.diff(offsets)
+    buildings = len(counts)
+    fitted = dict(xy=np.zeros((4 * buildings, 2)), offsets=np.arange(0, 4 * buildings + 1, 4, dtype=np.int64), ids=footprints['ids'])
+    for key in ('residuals', 'max_residuals', 'area_change'):
+        fitted[key] = np.zeros(buildings)
+    if buildings == 0:
+        return fitted
+    ring = np.repeat(np.arange(buildings), counts)
+    origin = xy[offsets[:-1]]
+    local = xy - origin[ring]                                                                                           # ring-local coordinates keep UTM values precise
+
+    if method == "minimum_area":
+        theta, low, high = _minimum_area_frame_(local, offsets)
+    elif method == "least_squares":
+        theta = orientation if isinstance(orientation, np.ndarray) else dominantOrientation(footprints, orientation)
+        low, high = _least_squares_frame_(local, offsets, theta)
+    else:
+        raise ValueError("unknown rectangle fit: " + str(method))
+
+    cos, sin = np.cos(theta), np.sin(theta)
+    frame = np.stack((np.column_stack((low[:, 0], low[:, 1])), np.column_stack((low[:, 0], high[:, 1])),
+                      np.column_stack((high[:, 0], high[:, 1])), np.column_stack((high[:, 0], low[:, 1]))), axis=1)     # clockwise in the frame
+    corners = np.empty_like(frame)
+    corners[:, :, 0] = frame[:, :, 0] * cos[:, None] - frame[:, :, 1] * sin[:, None] + origin[:, None, 0]
+    corners[:, :, 1] = frame[:, :, 0] * sin[:, None] + frame[:, :, 1] * cos[:, None] + origin[:, None, 1]
+    fitted['xy'] = corners.reshape(-1, 2)
+
+    u = local[:, 0] * cos[ring] + local[:, 1] * sin[ring]
+    v = local[:, 1] * cos[ring] - local[:, 0] * sin[ring]
+    distance = _rectangle_distance_(np.column_stack((u, v)), low[ring], high[ring])
+    fitted['residuals'] = np.sqrt(np.add.reduceat(distance ** 2, offsets[:-1]) / counts)
+    fitted['max_residuals'] = np.maximum.reduceat(distance, offsets[:-1])
+    area = np.abs(_ring_area_(local, offsets))
+    fitted['area_change'] = np.prod(high - low, axis=1) / np.maximum(area, 1e-300) - 1.
+    return fitted
+
+#============ shared walls of adjacent buildings (topology)
+
+# connected components of an undirected graph given as edge lists: min-label hooking with pointer jumping
+def _components_(count, a, b):                                                                                          # function to label connected nodes with the smallest node index of their component
+    parent = np.arange(count)
+    a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+    while len(a):
+        low = np.minimum(parent[a], parent[b])
+        np.minimum.at(parent, parent[a], low)                                                                           # hook both roots onto the smaller one
+        np.minimum.at(parent, parent[b], low)
+        while True:                                                                                                     # pointer jumping until every node points at a root
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        linked = parent[a] != parent[b]
+        a, b = a[linked], b[linked]
+    return parent
+
+# candidate edge pairs from a uniform grid: the grown bounding box of every edge against the midpoints of shorter edges
+def _grid_pairs_(start, end, margin, cell):                                                                             # function to list (longer, shorter) edge pairs whose midpoint falls in a cell of the longer edge box
+    lengths = np.hypot(*(end - start).T)
+    low = np.minimum(start, end) - margin
+    high = np.maximum(start, end) + margin
+    base = low.min(axis=0)
+    first = np.floor((low - base) / cell).astype(np.int64)
+    last = np.floor((high - base) / cell).astype(np.int64)
+    width = last[:, 0] - first[:, 0] + 1
+    covered = width * (last[:, 1] - first[:, 1] + 1)                                                                    # cells touched by each box
+    rows = int(last[:, 1].max()) + 1
+
+    box = np.repeat(np.arange(len(start)), covered)
+    step = _ranges_(np.zeros(len(start), dtype=np.int64), covered)
+    boxKey = (first[box, 0] + step % width[box]) * rows + first[box, 1] + step // width[box]
+    order = np.argsort(boxKey)
+    boxKey, box = boxKey[order], box[order]
+
+    # each midpoint lies in exactly one cell, so every pair comes up once and needs no deduplication
+    middle = np.floor(((start + end) / 2. - base) / cell).astype(np.int64)
+    pointKey = middle[:, 0] * rows + middle[:, 1]
+    lo, hi = np.searchsorted(boxKey, pointKey, 'left'), np.searchsorted(boxKey, pointKey, 'right')
+    b = np.repeat(np.arange(len(start)), hi - lo)
+    a = box[_ranges_(lo, hi - lo)]
+    longer = (lengths[a] > lengths[b]) | ((lengths[a] == lengths[b]) & (a < b))                                         # ties go to the lower edge index
+    return a[longer], b[longer]
+
+# edges of different buildings lying on one wall line: parallel (either direction), close and overlapping
+def sharedEdges(footprints, distance=0.5, angle=5.):                                                                    # function to find the shared or near-coincident walls of neighbouring buildings
+    """Return an (M, 2) array of edge pairs, an edge being the index of its first vertex."""
+    xy, offsets = footprints['xy'], footprints['offsets']
+    counts = np.diff(offsets)
+    if len(xy) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    ring = np.repeat(np.arange(len(counts)), counts)
+    _, nxt = _neighbours_(offsets)
+    start, end = xy, xy[nxt]
+    lengths = np.hypot(*(end - start).T)
+    cell = max(float(np.median(lengths)), 4. * distance, 1e-9)
+    a, b = _grid_pairs_(start, end, distance, cell)
+    different = (ring[a] != ring[b]) & (lengths[b] > 0)
+    a, b = a[different], b[different]
+
+    # the longer edge a carries the reference line
+    length = lengths[a]
+    ux, uy = (end[a] - start[a]).T / length
+    s0, s1 = start[b] - start[a], end[b] - start[a]                                                                     # the shorter edge seen from the start of the longer one
+    across0, across1 = s0[:, 1] * ux - s0[:, 0] * uy, s1[:, 1] * ux - s1[:, 0] * uy
+    middle = ((s0[:, 0] + s1[:, 0]) * ux + (s0[:, 1] + s1[:, 1]) * uy) / 2.
+
+    parallel = np.abs(across1 - across0) <= np.sin(np.radians(angle)) * lengths[b]
+    close = np.maximum(np.abs(across0), np.abs(across1)) <= distance
+    shared = parallel & close & (middle >= 0.) & (middle <= length)
+    return np.column_stack((a[shared], b[shared]))
+
+# shared edge pairs of a buffer, renumbered for a subset of its buildings
+def _subset_pairs_(pairs, offsets, rings):                                                                              # function to reuse one sharedEdges search for every subset of the same buildings
+    kept = np.repeat(rings, np.diff(offsets))
+    index = np.cumsum(kept) - 1                                                                                         # vertex index within the subset
+    inside = kept[pairs[:, 0]] & kept[pairs[:, 1]]
+    return index[pairs[inside]]
+
+# one orientation per group of buildings joined by shared walls
+def componentOrientation(footprints, orientation, pairs):                                                               # function to give connected buildings their common perimeter-weighted orientation
+    offsets = footprints['offsets']
+    buildings = len(offsets) - 1
+    ring = np.repeat(np.arange(buildings), np.diff(offsets))
+    group = _components_(buildings, ring[pairs[:, 0]], ring[pairs[:, 1]])
+    if 'lengths' not in footprints:
+        footprints = edgeSummary(footprints)
+    weight = np.add.reduceat(footprints['lengths'], offsets[:-1]) if buildings else np.zeros(0)
+    c = np.bincount(group, weight * np.cos(4. * orientation), minlength=buildings)                                      # mean on the 4-fold circle, like _circular_orientation_
+    s = np.bincount(group, weight * np.sin(4. * orientation), minlength=buildings)
+    common = (np.arctan2(s, c) / 4.) % (np.pi / 2.)
+    alone = np.bincount(group, minlength=buildings)[group] == 1
+    return np.where(alone, orientation, common[group])                                                                  # buildings without shared walls keep their own
+
+# move walls joined by shared edges onto one line, each at the length-weighted mean of its members
+def _shared_walls_(wall, label, along, weights, origin, orientation, shared, valid):                                    # function to make shared walls of regularized neighbours coincide
+    a, b = shared[:, 0], shared[:, 1]
+    keep = valid[a] & valid[b] & (along[a] == along[b])                                                                 # both buildings snapped, both edges on the same frame axis
+    if not keep.any():
+        return wall
+    walls = len(wall)
+    wallAlong, wallOrigin, wallAngle = np.zeros(walls, dtype=bool), np.zeros((walls, 2)), np.zeros(walls)
+    wallAlong[label], wallOrigin[label], wallAngle[label] = along, origin, orientation
+    normal = np.where(wallAlong[:, None], np.column_stack((-np.sin(wallAngle), np.cos(wallAngle))), np.column_stack((np.cos(wallAngle), np.sin(wallAngle))))
+    base = (normal * wallOrigin).sum(axis=1)                                                                            # wall offsets are relative to each building origin
+
+    group = _components_(walls, label[a[keep]], label[b[keep]])
+    weight = np.bincount(label, weights, minlength=walls)
+    common = np.bincount(group, weight * (wall + base), minlength=walls) / np.maximum(np.bincount(group, weight, minlength=walls), 1e-300)
+    joined = np.zeros(walls, dtype=bool)
+    joined[label[a[keep]]] = joined[label[b[keep]]] = True
+    return np.where(joined, common[group] - base, wall)
+
+# regularize neighbours together: buildings joined by shared walls get one orientation and shared walls one line
+def regularizeTopology(footprints, epsilon=15., orientation="histogram", pairs=None, distance=0.5, angle=5.): # function to regularize adjacent buildings without gaps or overlaps between them
+    """Return regularized footprints whose shared walls stay coincident."""
+    if pairs is None:
+        pairs = sharedEdges(footprints, distance, angle)
+    theta = componentOrientation(footprints, dominantOrientation(footprints, orientation), pairs)
+    fixed, fixed['snapped'] = regularizeRings(footprints, epsilon, theta, shared=pairs)
+    return fixed
+
+#============ validation and quality metrics
+
+NOT_CLOSED, COUNTERCLOCKWISE, DEGENERATE_EDGE, MULTIPART, SELF_INTERSECTION, ZERO_AREA, TOO_FEW_VERTICES = 1, 2, 4, 8, 16, 32, 64 # reason bits of validateFootprints
+REGULARIZED, COLLAPSED = 128, 256                                                                                       # reason bits added by regularizeFootprints
+REASONS = ((NOT_CLOSED, "not closed"), (COUNTERCLOCKWISE, "counterclockwise"), (DEGENERATE_EDGE, "degenerate edge"), (MULTIPART, "holes or multipart"),
+           (SELF_INTERSECTION, "self-intersection"), (ZERO_AREA, "zero area"), (TOO_FEW_VERTICES, "too few vertices"), (REGULARIZED, "invalid once regularized"),
+           (COLLAPSED, "collapsed by simplification"))
+REJECT = MULTIPART | SELF_INTERSECTION | ZERO_AREA | TOO_FEW_VERTICES                                                   # reasons that send a building to the reject file; the others are repaired on the way
+
+# pairs of boxes of the same group sharing a grid cell, each pair listed once in the first cell the two boxes share
+def _box_pairs_(low, high, cell, group):                                                                                # function to list every pair of overlapping grid footprints within contiguous groups in O(n log n)
+    begins = np.concatenate(([True], group[1:] != group[:-1]))
+    base = np.minimum.reduceat(low, np.flatnonzero(begins), axis=0)[np.cumsum(begins) - 1]                              # every group gets its own small grid
+    first = np.floor((low - base) / cell).astype(np.int64)
+    last = np.floor((high - base) / cell).astype(np.int64)
+    width = last[:, 0] - first[:, 0] + 1
+    covered = width * (last[:, 1] - first[:, 1] + 1)
+    box = np.repeat(np.arange(len(low)), covered)
+    step = _ranges_(np.zeros(len(low), dtype=np.int64), covered)
+    cx, cy = first[box, 0] + step % width[box], first[box, 1] + step // width[box]
+    key = (group[box] * (int(last[:, 0].max()) + 1) + cx) * (int(last[:, 1].max()) + 1) + cy
+    order = np.argsort(key)
+    box, cx, cy, key = box[order], cx[order], cy[order], key[order]
+
+    boundary = np.flatnonzero(np.diff(key)) + 1
+    cellEnd = np.repeat(np.concatenate((boundary, [len(key)])), np.diff(np.concatenate(([0], boundary, [len(key)]))))
+    partners = cellEnd - np.arange(len(key)) - 1
+    left = np.repeat(np.arange(len(key)), partners)
+    right = _ranges_(np.arange(len(key)) + 1, partners)
+    a, b = box[left], box[right]
+    reference = (cx[left] == np.maximum(first[a, 0], first[b, 0])) & (cy[left] == np.maximum(first[a, 1], first[b, 1]))
+    return a[reference], b[reference]
+
+# orientation of the turn o -> u -> w for rows of points
+def _cross_(o, u, w):                                                                                                   # function to compute the z component of (u - o) x (w - o)
+    return (u[:, 0] - o[:, 0]) * (w[:, 1] - o[:, 1]) - (u[:, 1] - o[:, 1]) * (w[:, 0] - o[:, 0])
+
+# rings whose non-adjacent edges cross or touch, found through a grid index over the edges of every ring
+def _self_intersections_(xy, offsets):                                                                                  # function to flag self-intersecting rings without testing every pair of edges
+    counts = np.diff(offsets)
+    buildings = len(counts)
+    crossing = np.zeros(buildings, dtype=bool)
+    if len(xy) == 0:
+        return crossing
+    ring = np.repeat(np.arange(buildings), counts)
+    _, nxt = _neighbours_(offsets)
+    start, end = xy, xy[nxt]
+    cell = max(float(np.median(np.hypot(*(end - start).T))), 1e-9)
+    a, b = _box_pairs_(np.minimum(start, end), np.maximum(start, end), cell, ring)
+    keep = (nxt[a] != b) & (nxt[b] != a)                                                                                # edges sharing a vertex always touch
+    a, b = a[keep], b[keep]
+
+    origin = start[a]                                                                                                   # local coordinates keep the cross products precise
+    p1, p2, q1, q2 = start[a] - origin, end[a] - origin, start[b] - origin, end[b] - origin
+    d1, d2, d3, d4 = _cross_(q1, q2, p1), _cross_(q1, q2, p2), _cross_(p1, p2, q1), _cross_(p1, p2, q2)
+    collinear = (d1 == 0) & (d2 == 0)
+    overlap = np.all(np.maximum(np.minimum(p1, p2), np.minimum(q1, q2)) <= np.minimum(np.maximum(p1, p2), np.maximum(q1, q2)), axis=1)
+    hit = np.where(collinear, overlap, (d1 * d2 <= 0) & (d3 * d4 <= 0))
+    crossing[ring[a[hit]]] = True
+    return crossing
+
+# check the README validity assumptions for every building at once
+def validateFootprints(footprints, minimumEdge=1e-6):                                                                   # function to return the reason bits of every building, 0 for valid ones
+    """Return one uint16 of REASONS bits per building."""
+    xy, offsets = footprints['xy'], footprints['offsets']
+    counts = np.diff(offsets)
+    codes = np.zeros(len(counts), dtype=np.uint16)
+    if (counts == 0).any():                                                                                             # empty rings would upset the reduceat calls below
+        codes[counts == 0] = TOO_FEW_VERTICES
+        codes[counts > 0] = validateFootprints(_subset_(footprints, rings=counts > 0), minimumEdge)
+        return codes
+    if len(counts) == 0:
+        return codes
+    if 'closed' in footprints:
+        codes[~np.asarray(footprints['closed'], dtype=bool)] |= NOT_CLOSED
+    if 'parts' in footprints:
+        codes[np.asarray(footprints['parts']) > 1] |= MULTIPART
+
+    _, nxt = _neighbours_(offsets)
+    short = np.hypot(*(xy[nxt] - xy).T) < minimumEdge
+    codes[np.logical_or.reduceat(short, offsets[:-1])] |= DEGENERATE_EDGE
+    codes[np.add.reduceat((~short).astype(np.int64), offsets[:-1]) < 3] |= TOO_FEW_VERTICES
+
+    ring = np.repeat(np.arange(len(counts)), counts)
+    area = _ring_area_(xy - xy[offsets[:-1]][ring], offsets)                                                            # ring-local coordinates keep the area precise
+    codes[area > 0] |= COUNTERCLOCKWISE
+    codes[np.abs(area) < minimumEdge ** 2] |= ZERO_AREA
+
+    clean = _subset_(dict(xy=xy, offsets=offsets, ids=footprints['ids']), vertices=~short)                              # repeated vertices would make neighbouring edges look crossing
+    codes[_self_intersections_(clean['xy'], clean['offsets'])] |= SELF_INTERSECTION
+    return codes
+
+# readable reasons of a reason code
+def reasonNames(code):                                                                                                  # function to spell out the bits of one validateFootprints code
+    return ", ".join(name for bit, name in REASONS if int(code) & bit)
+
+# distance of every point to the outline of one ring of a flat buffer, (point, edge) pairs a batch at a time
+def _outline_distance_(points, owner, xy, offsets, batch=1 << 21):                                                      # function to measure points against the ring given by owner in bounded memory
+    size = np.diff(offsets)[owner]
+    _, nxt = _neighbours_(offsets)
+    distance = np.zeros(len(points))
+    total = np.cumsum(size)
+    cuts = np.unique(np.concatenate(([0], np.searchsorted(total, np.arange(batch, total[-1], batch) if len(total) else []), [len(points)])))
+    for first, last in zip(cuts[:-1], cuts[1:]):                                                                        # about batch pairs per step
+        pair = np.repeat(np.arange(first, last), size[first:last])
+        edge = _ranges_(offsets[:-1][owner[first:last]], size[first:last])
+        pairDistance = _segment_distance_(points[pair], xy[edge], xy[nxt[edge]])
+        distance[first:last] = np.minimum.reduceat(pairDistance, np.concatenate(([0], np.cumsum(size[first:last])[:-1])))
+    return distance
+
+# per-building change between input and regularized footprints
+def qualityMetrics(before, after):                                                                                      # function to compare every output building with its input
+    """Return ids, 'area_change' (relative), 'hausdorff' (metres) and 'corner_error' (degrees)."""
+    metrics = dict(ids=after['ids'], area_change=np.zeros(len(after['ids'])), hausdorff=np.zeros(len(after['ids'])), corner_error=np.zeros(len(after['ids'])))
+    if len(after['ids']) == 0:
+        return metrics
+    source = _merge_footprints_([_subset_(before, rings=np.isin(before['ids'], after['ids']))])                         # inputs in id order, as after
+    target = _merge_footprints_([after])
+    restore = np.argsort(np.argsort(after['ids'], kind='mergesort'), kind='mergesort')                                  # back to the order of after
+
+    sourceCounts, targetCounts = np.diff(source['offsets']), np.diff(target['offsets'])
+    sourceRing = np.repeat(np.arange(len(sourceCounts)), sourceCounts)
+    targetRing = np.repeat(np.arange(len(targetCounts)), targetCounts)
+    origin = source['xy'][source['offsets'][:-1]]
+    sourceXY, targetXY = source['xy'] - origin[sourceRing], target['xy'] - origin[targetRing]
+
+    sourceArea = np.abs(_ring_area_(sourceXY, source['offsets']))
+    targetArea = np.abs(_ring_area_(targetXY, target['offsets']))
+    forward = _outline_distance_(sourceXY, sourceRing, targetXY, target['offsets'])
+    backward = _outline_distance_(targetXY, targetRing, sourceXY, source['offsets'])
+    hausdorff = np.maximum(np.maximum.reduceat(forward, source['offsets'][:-1]), np.maximum.reduceat(backward, target['offsets'][:-1]))
+    angles = ringAngles(dict(xy=targetXY, offsets=target['offsets']))
+    nearest = np.clip(np.round(angles / 90.), 1, 3) * 90.                                                               # the corner classes of classifyBuildings
+
+    metrics['area_change'] = (targetArea / np.maximum(sourceArea, 1e-300) - 1.)[restore]
+    metrics['hausdorff'] = hausdorff[restore]
+    metrics['corner_error'] = np.maximum.reduceat(np.abs(angles - nearest), target['offsets'][:-1])[restore]
+    return metrics
+
+# counts per reason and the spread of the metrics, for logs and release gates
+def qualityReport(codes, metrics):                                                                                      # function to summarize validation codes and quality metrics as a JSON-able dict
+    report = dict(buildings=int(len(codes)), valid=int(np.sum(codes == 0)), rejected=int(np.sum((codes & (REJECT | REGULARIZED | COLLAPSED)) != 0)), reasons=dict())
+    for bit, name in REASONS:
+        report['reasons'][name] = int(np.sum((codes & bit) != 0))
+    for key in ('area_change', 'hausdorff', 'corner_error'):
+        values = np.abs(metrics[key])
+        spread = dict(mean=None, p95=None, max=None)
+        if len(values):
+            spread = dict(mean=float(values.mean()), p95=float(np.percentile(values, 95)), max=float(values.max()))
+        report[key] = spread
+    return report
+
+# input buildings that failed validation, with their reason code
+def writeRejects(path, footprints, codes, prj=None):                                                                    # function to write rejected buildings as a shapefile with RIGHT_ID, REASON and REASONS
+    fields = (("RIGHT_ID", "N", 10, 0), ("REASON", "N", 4, 0), ("REASONS", "C", 120, 0))
+    attributes = dict(RIGHT_ID=footprints['ids'], REASON=codes, REASONS=[reasonNames(code) for code in codes])
+    writeShapefile(path, footprints, prj=prj, fields=fields, attributes=attributes)
+
+#============ epsilon classification
+
+ORTHOGONAL, FIXABLE, OUT_OF_TOLERANCE = 0, 1, 2                                                                         # building classes of classifyBuildings
+
+# classify every building from its vertex angles (ringAngles / _building_angles_ output)
+def classifyBuildings(angles, offsets, epsilon=15., squareTolerance=1e-3):                                              # function to label buildings orthogonal, fixable or out of tolerance
+    """Return one class per building."""
+    counts = np.diff(offsets)
+    if len(counts) == 0:
+        return np.zeros(0, dtype=np.int8)
+    nearest = np.clip(np.round(angles / 90.), 1, 3) * 90.
+    worst = np.maximum.reduceat(np.abs(angles - nearest), offsets[:-1])
+    status = np.where(worst <= squareTolerance, ORTHOGONAL, np.where(worst <= epsilon, FIXABLE, OUT_OF_TOLERANCE))
+    status[counts < 4] = OUT_OF_TOLERANCE                                                                               # triangles can never be made orthogonal
+    return status.astype(np.int8)
+
+# simplify, measure and regularize in-memory footprints
+def regularizeFootprints(footprints, tolerance=1, epsilon=15., keepUnchanged=False, orientation="histogram", topology=False, fit=None, validate=False, shared=None, squareTolerance=1e-3): # function to run every computation stage on a flat buffer, no I/O
+    original = footprints
+    if validate:                                                                                                        # buildings breaking the validity assumptions go to 'rejected' instead of the output
+        with stage("validate") as record:
+            validation = validateFootprints(footprints)
+            footprints = _subset_(footprints, rings=(validation & REJECT) == 0)
+            record.update(_sizes_(footprints), rejected=int(np.sum((validation & REJECT) != 0)))
+    source = footprints
+
+    if tolerance is not None:
+        with stage("simplify") as record:
+            footprints = simplifyRings(footprints, tolerance)                                                           # headless simplification, no ArcGIS Advanced license needed
+            record.update(_sizes_(footprints))
+            if validate:
+                collapsed = source['ids'][~np.isin(source['ids'], footprints['ids'])]                                   # fewer than 3 vertices left, dropped by simplifyRings
+                order = np.argsort(original['ids'], kind='mergesort')
+                validation[order[np.searchsorted(original['ids'][order], collapsed)]] |= COLLAPSED
+                record.update(rejected=len(collapsed))
+
+    with stage("summary") as record:
+        reuse = tolerance is None and all(key in footprints for key in _SUMMARY_KEYS_)                                  # footprints summarized once for several epsilons
+        summary = footprints if reuse else edgeSummary(footprints)                                                      # one pass; every later stage reads this structure
+        record.update(_sizes_(summary))
+    result = dict()
+    result['summary'] = summary
+    result['angles'] = summary['angles']
+    result['angle_errors'] = 90 - result['angles']
+    result['lengths'] = summary['lengths']
+    with stage("classify") as record:
+        result['status'] = classifyBuildings(summary['angles'], summary['offsets'], epsilon, squareTolerance)
+        record.update(_sizes_(summary))
+    result['status_ids'] = summary['ids']
+
+    if topology and fit is not None:
+        raise ValueError("rectangle fits ignore the neighbours: use either topology or fit")
+    fixable = result['status'] == FIXABLE                                                                               # only these are rebuilt
+    if topology:
+        with stage("sharedEdges") as record:
+            movable = result['status'] != OUT_OF_TOLERANCE                                                              # orthogonal neighbours take part, fixable ones snap onto them
+            candidates = _subset_(summary, rings=movable)
+            result['shared'] = sharedEdges(candidates) if shared is None else _subset_pairs_(shared, summary['offsets'], movable) # pairs found once over all buildings
+            record.update(_sizes_(candidates), pairs=len(result['shared']))
+
+    with stage("regularize") as record:
+        if topology:
+            result['fixed'] = regularizeTopology(candidates, epsilon, orientation, result['shared'])                    # orthogonal neighbours are written as placed on their shared walls
+        else:
+            result['fixed'] = regularizeBuildings(_subset_(summary, rings=fixable), epsilon, orientation, fit)
+            if fit is not None:                                                                                         # per-building fit quality, in the order of status_ids
+                fitted = np.flatnonzero(fixable)[np.argsort(summary['ids'][fixable], kind='mergesort')]
+                for key in ('residuals', 'max_residuals', 'area_change'):
+                    result[key] = np.full(len(fixable), np.nan)
+                    result[key][fitted] = result['fixed'][key]
+        result['status'], result['fixed'] = _unsnapped_(result['status'], summary['ids'], result['fixed'])
+        record.update(_sizes_(result['fixed']))
+        copied = _unchanged_(result['status'], keepUnchanged) & ~np.isin(summary['ids'], result['fixed']['ids'])
+        result['fixed'] = _merge_footprints_([result['fixed'], _subset_(summary, rings=copied)])                        # copy the other buildings through as they are
+
+    if validate:
+        with stage("metrics") as record:
+            post = validateFootprints(result['fixed'])                                                                  # regularization can still fold a ring onto itself
+            broken = (post & REJECT) != 0
+            order = np.argsort(original['ids'], kind='mergesort')
+            position = order[np.searchsorted(original['ids'][order], result['fixed']['ids'][broken])]
+            validation[position] |= post[broken] | REGULARIZED
+            result['fixed'] = _subset_(result['fixed'], rings=~broken)
+            result['metrics'] = qualityMetrics(source, result['fixed'])
+            record.update(_sizes_(result['fixed']), rejected=int(broken.sum()))
+        rejected = (validation & (REJECT | REGULARIZED | COLLAPSED)) != 0
+        result['validation'], result['validation_ids'] = validation, original['ids']
+        result['rejected'] = _subset_(original, rings=rejected)
+        result['rejected']['codes'] = validation[rejected]
+        result['report'] = qualityReport(validation, result['metrics'])
+    result['ids'] = result['fixed']['ids']
+    return result
+
+# buildings written as they are: the orthogonal ones, and with keepUnchanged the out of tolerance ones too
+def _unchanged_(status, keepUnchanged=False):                                                                           # function to select the buildings copied through instead of regularized
+    return status != FIXABLE if keepUnchanged else status == ORTHOGONAL
+
+# single pass: read once, keep every stage in memory and write only the final output
+def inMemoryPipeline(inFC, outFC, spatRef=None, tolerance=1, simplifier="numpy", backend="native", epsilon=15., keepUnchanged=False, orientation="histogram", cache=None, columns=None, topology=False, fit=None, rejects=None, metrics=None, squareTolerance=1e-3): # function to regularize buildings without temp shapefiles
+    if simplifier == "numpy":
+        with stage("read") as record:
+            footprints = readShapefile(inFC, attributes=False) if backend == "native" else readFootprints(inFC)         # attributes are not written to the output
+            record.update(_sizes_(footprints))
+    else:
+        simplifiedFC = "in_memory/simplifyBuildings"                                                                    # simplification result stays in the in_memory workspace
+        with stage("simplifyBuilding"):
+            simplifyBuilding(inFC, simplifiedFC, tolerance)
+        with stage("read") as record:
+            footprints = readFootprints(simplifiedFC)
+            record.update(_sizes_(footprints))
+        arcpy.Delete_management(simplifiedFC)
+        tolerance = None
+
+    if cache is not None:
+        result = cachedRegularize(footprints, cache, tolerance, epsilon, keepUnchanged, orientation, fit, squareTolerance) # only new or changed buildings are recomputed
+    else:
+        result = regularizeFootprints(footprints, tolerance, epsilon, keepUnchanged, orientation, topology, fit, rejects is not None or metrics is not None, squareTolerance=squareTolerance)
+
+    if rejects is not None:
+        with stage("writeRejects") as record:
+            writeRejects(rejects, result['rejected'], result['rejected']['codes'], prj=footprints.get('prj'))
+            record.update(_sizes_(result['rejected']))
+    if metrics is not None:
+        with open(metrics, 'w') as report:
+            json.dump(result['report'], report, indent=2, sort_keys=True)
+
+    if columns is not None:
+        with stage("writeColumns") as record:
+            summary = dict(result['summary'], status=result['status'])
+            summary.update((key, result[key]) for key in ('residuals', 'max_residuals', 'area_change') if key in result)
+            writeColumns(columns, summary, segmentColumns(summary), SEGMENT_SCOPES, **_source_(inFC, tolerance=tolerance, epsilon=epsilon))
+            record.update(_sizes_(summary))
+
+    if backend == "native":
+        writeOutput(outFC, result['fixed'], prj=footprints.get('prj'))                                                  # records its own write stage
+    else:
+        with stage("write") as record:
+            spatRef = spatRef or loadArcpy().Describe(inFC).spatialReference
+            createEmptyShapefile(os.path.dirname(outFC), os.path.basename(outFC), spatRef)
+            fixedFootprints(result['fixed'], outFC)
+            record.update(_sizes_(result['fixed']))
+    return result
+
+# output path of one scale: the tolerance and epsilon go into the file name
+def _scale_path_(path, tolerance, epsilon):                                                                             # function to name the outputs of multiScalePipeline, e.g. fixed_t0p5_e15.shp
+    root, extension = os.path.splitext(path)
+    return "%s_t%s_e%s%s" % (root, ("%g" % tolerance).replace('.', 'p'), ("%g" % epsilon).replace('.', 'p'), extension)
+
+# several (tolerance, epsilon) scales from one read: one output per scale
+def multiScalePipeline(inFC, outFC, scales=None, tolerance=1, epsilon=15., keepUnchanged=False, orientation="histogram", topology=False, fit=None, writerQueue=1, squareTolerance=1e-3): # function to regularize buildings for several map scales in a single pass
+    """Return (tolerance, epsilon, path, result) for every scale, in the order of scales."""
+    scales = [(float(t), float(e)) for t, e in (scales or [(tolerance, epsilon)])]
+    with stage("read") as record:
+        footprints = readShapefile(inFC, attributes=False)
+        record.update(_sizes_(footprints))
+    with stage("simplificationLevels") as record:
+        levels = simplificationLevels(footprints)                                                                       # shared by every tolerance
+        record.update(_sizes_(footprints))
+
+    done, writers = dict(), []
+    try:
+        for scaleTolerance in sorted(set(t for t, _ in scales)):
+            with stage("simplify", tolerance=scaleTolerance) as record:
+                summary = simplifyRings(footprints, scaleTolerance, levels=levels)
+                record.update(_sizes_(summary))
+            with stage("summary", tolerance=scaleTolerance) as record:
+                summary = edgeSummary(summary)                                                                          # shared by every epsilon of this tolerance
+                record.update(_sizes_(summary))
+            shared = None
+            if topology:
+                with stage("sharedEdges", tolerance=scaleTolerance) as record:
+                    shared = sharedEdges(summary)
+                    record.update(_sizes_(summary), pairs=len(shared))
+            for scaleEpsilon in sorted(set(e for t, e in scales if t == scaleTolerance)):
+                with stage("scale", tolerance=scaleTolerance, epsilon=scaleEpsilon):
+                    result = regularizeFootprints(summary, None, scaleEpsilon, keepUnchanged, orientation, topology, fit, shared=shared, squareTolerance=squareTolerance)
+                path = _scale_path_(outFC, scaleTolerance, scaleEpsilon)
+                writers.append(openOutput(path, prj=footprints.get('prj'), queueSize=writerQueue))
+                appendOutput(writers[-1], result['fixed'])                                                              # written while the next scale is computed
+                done[scaleTolerance, scaleEpsilon] = (scaleTolerance, scaleEpsilon, path, result)
+    finally:
+        for writer in writers:
+            closeOutput(writer)
+    return [done[scale] for scale in scales]
+
+#============ incremental re-processing cache
+
+CACHE_VERSION = 5                                                                                                       # part of every cache key, bump it when an algorithm change alters the output of unchanged input
+_HASH_SEEDS_ = (0x9e3779b97f4a7c15, 0xd1b54a32d192ed03)                                                                 # one seed per 64-bit half of the ring hash
+_CACHE_ENTRY_BYTES_ = 40                                                                                                # key, status, last use and offset bytes per cached building, added to its geometry
+
+# splitmix64 finalizer, element-wise on uint64 arrays (wraps modulo 2**64)
+def _mix64_(h):                                                                                                         # function to scramble 64-bit integers without a per-value loop
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xbf58476d1ce4e5b9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+# content hash of every ring: any moved, added, removed or reordered vertex changes it
+def ringHashes(footprints, salt=0):                                                                                     # function to compute the (N, 2) int64 128-bit hash of every building from its exact coordinates
+    xy, offsets = np.ascontiguousarray(footprints['xy'], dtype=np.float64), footprints['offsets']
+    counts = np.diff(offsets)
+    bits = xy.view(np.uint64).reshape(-1, 2)
+    position = (np.arange(len(xy)) - np.repeat(offsets[:-1], counts)).astype(np.uint64)                                 # vertex number within its ring
+    filled = counts > 0
+    hashes = np.zeros((len(counts), 2), dtype=np.uint64)
+    for column, seed in enumerate(_HASH_SEEDS_):
+        seed = np.uint64((seed ^ salt) & 0xffffffffffffffff)
+        vertex = _mix64_(_mix64_(bits[:, 0] ^ seed) ^ bits[:, 1])
+        vertex = _mix64_(vertex + position * seed)
+        if filled.any():
+            hashes[filled, column] = np.add.reduceat(vertex, offsets[:-1][filled])
+        hashes[:, column] = _mix64_(hashes[:, column] ^ counts.astype(np.uint64))
+    return hashes.view(np.int64)
+
+# one integer for the parameters that change the output of a building
+def _cache_parameters_(tolerance, epsilon, keepUnchanged, orientation, fit=None, squareTolerance=1e-3):                 # function to salt the ring hashes so that other parameters never match
+    parameters = [CACHE_VERSION, None if tolerance is None else float(tolerance), float(epsilon), bool(keepUnchanged), orientation, float(squareTolerance)]
+    text = json.dumps(parameters + ([fit] if fit is not None else []))                                                  # keys of caches written before rectangle fits stay valid
+    return struct.unpack('<Q', hashlib.md5(text.encode('utf-8')).digest()[:8])[0]
+
+# cached buildings in the flat buffer layout, keyed instead of identified
+def _cache_entries_(keys=None, status=None, used=None, xy=None, offsets=None):                                          # function to build the arrays of a (possibly empty) cache
+    entries = dict()
+    entries['keys'] = np.zeros((0, 2), dtype=np.int64) if keys is None else keys
+    entries['status'] = np.zeros(0, dtype=np.int8) if status is None else status
+    entries['used'] = np.zeros(0, dtype=np.int64) if used is None else used
+    entries['xy'] = np.zeros((0, 2)) if xy is None else xy
+    entries['offsets'] = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+    return entries
+
+# rows of a cache, geometry included; rings may be empty here, unlike in _subset_
+def _take_entries_(entries, rows):                                                                                      # function to gather cache entries without a per-entry loop
+    counts = np.diff(entries['offsets'])[rows]
+    return _cache_entries_(entries['keys'][rows], entries['status'][rows], entries['used'][rows],
+                           entries['xy'][_ranges_(entries['offsets'][:-1][rows], counts)],
+                           np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+
+# load the on-disk cache of regularized buildings, or start an empty one
+def openCache(path, maxBytes=1 << 30):                                                                                  # function to return the cache state used by cachedRegularize and closeCache
+    cache = dict(path=path, maxBytes=maxBytes, run=1, hits=0, misses=0, pending=[])
+    cache['entries'] = _cache_entries_()
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            if int(stored['version']) == CACHE_VERSION:                                                                 # other versions are dropped as a whole
+                cache['entries'] = _cache_entries_(stored['keys'], stored['status'], stored['used'], stored['xy'], stored['offsets'])
+                cache['run'] = int(stored['run']) + 1                                                                   # least recently used entries are evicted first
+    return cache
+
+# merge the new buildings in, drop the least recently used ones above maxBytes and sort by key for lookups
+def _compact_cache_(cache):                                                                                             # function to rebuild the sorted entry arrays, returns the number of evicted buildings
+    entries = cache['entries']
+    if cache['pending']:
+        parts = [entries] + cache['pending']
+        counts = np.concatenate([np.diff(part['offsets']) for part in parts])
+        entries = _cache_entries_(np.concatenate([part['keys'] for part in parts]), np.concatenate([part['status'] for part in parts]),
+                                  np.concatenate([part['used'] for part in parts]), np.concatenate([part['xy'] for part in parts]),
+                                  np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+        cache['pending'] = []
+
+    newest = np.lexsort((-np.arange(len(entries['used'])), -entries['used']))                                           # latest use first, latest insert first on ties
+    keys = entries['keys'][newest]
+    first = np.ones(len(keys), dtype=bool)
+    if len(keys):
+        order = np.lexsort((keys[:, 1], keys[:, 0]))                                                                    # stable, so the newest copy of a key comes first
+        same = (keys[order][1:] == keys[order][:-1]).all(axis=1)
+        first[order[1:][same]] = False
+    newest = newest[first]
+    size = np.diff(entries['offsets'])[newest] * 16 + _CACHE_ENTRY_BYTES_
+    keep = newest[np.cumsum(size) <= cache['maxBytes']]
+    keep = keep[np.argsort(entries['keys'][keep, 0], kind='mergesort')]                                                 # sorted by the first key half for searchsorted
+    cache['entries'] = _take_entries_(entries, keep)
+    return int(first.sum()) - len(keep)
+
+# evict, save and forget the cache
+def closeCache(cache):                                                                                                  # function to write a cache opened with openCache, atomically
+    evicted = _compact_cache_(cache)
+    entries = cache['entries']
+    temporary = cache['path'] + '.tmp'
+    with open(temporary, 'wb') as output:                                                                               # a file object, so np.savez keeps the name as is
+        np.savez(output, version=CACHE_VERSION, run=cache['run'], **entries)
+    if os.path.exists(cache['path']) and not hasattr(os, 'replace'):                                                    # Python 2.7 on Windows cannot rename over a file
+        os.remove(cache['path'])
+    getattr(os, 'replace', os.rename)(temporary, cache['path'])
+    return evicted
+
+# regularizeFootprints through the cache: only new or changed buildings are computed
+def cachedRegularize(footprints, cache, tolerance=1, epsilon=15., keepUnchanged=False, orientation="histogram", fit=None, squareTolerance=1e-3): # function returning the status and fixed buildings like regularizeFootprints
+    """Same 'status', 'status_ids', 'fixed' and 'ids' as regularizeFootprints."""
+    with stage("cacheLookup") as record:
+        keys = ringHashes(footprints, _cache_parameters_(tolerance, epsilon, keepUnchanged, orientation, fit, squareTolerance))
+        entries = cache['entries']
+        row = np.minimum(np.searchsorted(entries['keys'][:, 0], keys[:, 0]), max(len(entries['keys']) - 1, 0))
+        hit = (entries['keys'][row] == keys).all(axis=1) if len(entries['keys']) else np.zeros(len(keys), dtype=bool)
+        entries['used'][row[hit]] = cache['run']
+        found = _take_entries_(entries, row[hit])
+        record.update(records=len(keys), hits=int(hit.sum()))
+
+    buildings = len(keys)
+    status = np.full(buildings, -1, dtype=np.int8)                                                                      # -1: ring collapsed by the simplification
+    status[hit] = found['status']
+    filled = np.diff(found['offsets']) > 0                                                                              # cached buildings that have an output ring
+    shown = _take_entries_(found, np.flatnonzero(filled))
+    parts = [dict(xy=shown['xy'], offsets=shown['offsets'], ids=np.flatnonzero(hit)[filled])]
+
+    missed = np.flatnonzero(~hit)
+    if len(missed):
+        changed = _subset_(footprints, rings=~hit)
+        changed['ids'] = missed                                                                                         # positions, to put the results back in place
+        computed = regularizeFootprints(changed, tolerance, epsilon, keepUnchanged, orientation, fit=fit, squareTolerance=squareTolerance)
+        status[computed['status_ids']] = computed['status']
+        fixed = _merge_footprints_([computed['fixed']])                                                                 # in position order
+        counts = np.zeros(len(missed), dtype=np.int64)
+        counts[np.searchsorted(missed, fixed['ids'])] = np.diff(fixed['offsets'])
+        cache['pending'].append(_cache_entries_(keys[missed], status[missed], np.full(len(missed), cache['run'], dtype=np.int64),
+                                                fixed['xy'], np.concatenate(([0], np.cumsum(counts))).astype(np.int64)))
+        parts.append(fixed)
+    cache['hits'] += buildings - len(missed)
+    cache['misses'] += len(missed)
+
+    result = dict()
+    result['status'] = status[status >= 0]
+    result['status_ids'] = footprints['ids'][status >= 0]
+    result['fixed'] = _merge_footprints_(parts)
+    result['fixed']['ids'] = footprints['ids'][result['fixed']['ids']]
+    result['ids'] = result['fixed']['ids']
+    result['cache'] = dict(hits=buildings - len(missed), misses=len(missed))
+    return result
+
+#============ multiprocess tiled execution
+
+_shared_ = dict()                                                                                                       # worker side views of the shared coordinate buffers
+
+# order buildings tile by tile so every chunk covers a compact area
+def spatialOrder(footprints, chunkSize=50000):                                                                          # function to sort buildings by the grid tile of their centroid
+    xy, offsets = footprints['xy'], footprints['offsets']
+    counts = np.diff(offsets)
+    if len(counts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    centroid = np.add.reduceat(xy, offsets[:-1], axis=0) / counts[:, None]
+    low, high = centroid.min(axis=0), centroid.max(axis=0)
+    tiles = max(1., len(counts) / float(chunkSize))                                                                     # about one chunk of buildings per tile
+    tileSize = max(np.sqrt(np.prod(np.maximum(high - low, 1e-9)) / tiles), 1e-9)
+    cell = np.floor((centroid - low) / tileSize).astype(np.int64)
+    key = cell[:, 1] * (cell[:, 0].max() + 1) + cell[:, 0]                                                              # row-major tile number
+    return np.argsort(key, kind='mergesort')
+
+# copy an array into shared memory that worker processes map without copying
+def _share_(array, ctype):                                                                                              # function to allocate a RawArray and fill it from a NumPy array
+    import multiprocessing.sharedctypes
+    raw = multiprocessing.sharedctypes.RawArray(ctype, max(int(array.size), 1))
+    np.frombuffer(raw, dtype=array.dtype, count=array.size)[:] = array.ravel()
+    return raw
+
+# worker initializer: wrap the shared buffers in NumPy views, no data is copied
+def _init_worker_(xy, offsets, ids, buildings, vertices, options):                                                      # function run once per worker process
+    _shared_['xy'] = np.frombuffer(xy, dtype=np.float64, count=2 * vertices).reshape(-1, 2)
+    _shared_['offsets'] = np.frombuffer(offsets, dtype=np.int64, count=buildings + 1)
+    _shared_['ids'] = np.frombuffer(ids, dtype=np.int64, count=buildings)
+    _shared_['options'] = options
+
+# pool initializer: stage records are kept and sent back to the parent with every chunk
+def _init_pool_worker_(*initargs):                                                                                      # function run once per pool process instead of the inherited callbacks
+    _instrumentation_['callbacks'] = [_shared_.setdefault('records', []).append]
+    _init_worker_(*initargs)
+
+# regularize one chunk of consecutive buildings of the shared buffers
+def _regularize_chunk_(bounds):                                                                                         # function executed by the pool for every chunk
+    first, last = bounds
+    offsets = _shared_['offsets'][first:last + 1]
+    chunk = dict()
+    chunk['xy'] = _shared_['xy'][offsets[0]:offsets[-1]]                                                                # slice of the shared view
+    chunk['offsets'] = offsets - offsets[0]
+    chunk['ids'] = _shared_['ids'][first:last]
+    with stage("chunk", first=first, last=last) as record:
+        fixed = regularizeFootprints(chunk, **_shared_['options'])['fixed']
+        record.update(_sizes_(chunk))
+    collected = _shared_.get('records', [])                                                                             # filled only inside pool processes
+    records, collected[:] = list(collected), []
+    return fixed['xy'], fixed['offsets'], fixed['ids'], records
+
+# regularize buildings on a process pool and merge the chunks back in feature id order
+def parallelPipeline(inFC, outFC, workers=None, chunkSize=50000, tolerance=1, partition="tiles", epsilon=15., keepUnchanged=False, orientation="histogram", fit=None, squareTolerance=1e-3): # function to process large datasets on all cores
+    import ctypes, multiprocessing                                                                                      # only this pipeline pays for the import
+    with stage("read") as record:
+        footprints = readShapefile(inFC, attributes=False)
+        record.update(_sizes_(footprints))
+    xy, offsets, ids = footprints['xy'], footprints['offsets'], footprints['ids']
+    counts = np.diff(offsets)
+    workers = workers or multiprocessing.cpu_count()
+
+    with stage("partition", partition=partition) as record:
+        order = spatialOrder(footprints, chunkSize) if partition == "tiles" else np.arange(len(counts))
+        vertexOrder = _ranges_(offsets[:-1][order], counts[order])                                                      # buildings are stored tile by tile in shared memory
+        sharedXY = _share_(xy[vertexOrder], ctypes.c_double)
+        sharedOffsets = _share_(np.concatenate(([0], np.cumsum(counts[order]))).astype(np.int64), ctypes.c_int64)
+        sharedIds = _share_(ids[order], ctypes.c_int64)
+        record.update(_sizes_(footprints))
+        del vertexOrder
+
+    bounds = [(first, min(first + chunkSize, len(counts))) for first in range(0, len(counts), chunkSize)]
+    initargs = (sharedXY, sharedOffsets, sharedIds, len(counts), len(xy), dict(tolerance=tolerance, epsilon=epsilon, keepUnchanged=keepUnchanged, orientation=orientation, fit=fit, squareTolerance=squareTolerance))
+    if workers == 1 or len(bounds) <= 1:
+        _init_worker_(*initargs)
+        chunks = [_regularize_chunk_(b) for b in bounds]
+    else:
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context') and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')                                                               # workers inherit the shared buffers without pickling
+        pool = context.Pool(workers, _init_pool_worker_, initargs)
+        try:
+            chunks = pool.map(_regularize_chunk_, bounds, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        for chunk in chunks:
+            for record in chunk[3]:                                                                                     # worker stage records, tagged with the worker pid
+                _emit_(record)
+
+    merged = _merge_footprints_([dict(xy=c[0], offsets=c[1], ids=c[2]) for c in chunks])                                # back to the input feature order
+
+    writeOutput(outFC, merged, prj=footprints.get('prj'))
+    return merged
+
+
+#============ streaming pipeline with bounded memory
+
+# stream the input shapefile as fixed-size batches of footprints
+def streamFootprints(inFC, batchSize=10000):                                                                            # generator reading batchSize records at a time through the .shx index
+    for first in range(0, countRecords(inFC), batchSize):
+        with stage("read", batch=first // batchSize) as record:
+            batch = readShapefile(inFC, records=slice(first, first + batchSize), attributes=False)
+            record.update(_sizes_(batch))
+        yield batch
+
+# stream stage: simplification
+def streamSimplify(batches, tolerance=1):                                                                               # generator simplifying every batch
+    for batch in batches:
+        with stage("simplify") as record:
+            batch = simplifyRings(batch, tolerance)
+            record.update(_sizes_(batch))
+        yield batch
+
+# stream stage: fused edge summary (vertex angles and segment lengths)
+def streamSummary(batches):                                                                                             # generator adding the edge summary to every batch
+    for batch in batches:
+        with stage("summary") as record:
+            batch = edgeSummary(batch)
+            record.update(_sizes_(batch))
+        yield batch
+
+# stream stage: epsilon classification
+def streamClassify(batches, epsilon=15., squareTolerance=1e-3):                                                         # generator labelling every building of every batch
+    for batch in batches:
+        with stage("classify") as record:
+            batch['status'] = classifyBuildings(batch['angles'], batch['offsets'], epsilon, squareTolerance)
+            record.update(_sizes_(batch))
+        yield batch
+
+# stream stage: regularization
+def streamRegularize(batches, epsilon=15., keepUnchanged=False, orientation="histogram", fit=None):                     # generator turning every batch into regularized footprints
+    for batch in batches:
+        with stage("regularize") as record:
+            fixable = batch['status'] == FIXABLE
+            fixed = regularizeBuildings(_subset_(batch, rings=fixable), epsilon, orientation, fit)
+            status, fixed = _unsnapped_(batch['status'], batch['ids'], fixed)
+            record.update(_sizes_(fixed))
+            fixed = _merge_footprints_([fixed, _subset_(batch, rings=_unchanged_(status, keepUnchanged))])
+        yield fixed
+
+# stream stage: append the attributes of every classified batch to a columnar store
+def streamColumns(batches, store):                                                                                      # generator passing every batch on once it is stored
+    for batch in batches:
+        with stage("writeColumns") as record:
+            appendColumns(store, batch, segmentColumns(batch), SEGMENT_SCOPES)
+            record.update(_sizes_(batch))
+        yield batch
+
+# stream stage: every batch through the cache instead of the four stages above
+def streamCached(batches, cache, tolerance=1, epsilon=15., keepUnchanged=False, orientation="histogram", fit=None, squareTolerance=1e-3): # generator recomputing only the new or changed buildings of every batch
+    for batch in batches:
+        yield cachedRegularize(batch, cache, tolerance, epsilon, keepUnchanged, orientation, fit, squareTolerance)['fixed']
+
+# simplify -> edge summary (angles, lengths) -> classify -> regularize -> write, one batch in flight at a time
+def streamPipeline(inFC, outFC, batchSize=10000, tolerance=1, epsilon=15., keepUnchanged=False, orientation="histogram", cache=None, columns=None, writerQueue=2, fit=None, squareTolerance=1e-3): # function to process inputs larger than RAM
+    store = openColumns(columns) if columns is not None else None
+    if cache is not None:
+        batches = streamCached(streamFootprints(inFC, batchSize), cache, tolerance, epsilon, keepUnchanged, orientation, fit, squareTolerance)
+    else:
+        batches = streamSimplify(streamFootprints(inFC, batchSize), tolerance)
+        batches = streamClassify(streamSummary(batches), epsilon, squareTolerance)
+        if store is not None:
+            batches = streamColumns(batches, store)
+        batches = streamRegularize(batches, epsilon, keepUnchanged, orientation, fit)
+    writer = openOutput(outFC, prj=readPrj(inFC), queueSize=writerQueue)                                                # batch i is written while batch i + 1 is computed
+    try:
+        for batch in batches:
+            appendOutput(writer, batch)
+    finally:
+        records = closeOutput(writer)
+    if store is not None:
+        closeColumns(store, **_source_(inFC, tolerance=tolerance, epsilon=epsilon))
+    return records
+
+
+#============ library and command line entry points
+
+# the original workflow: one temp shapefile per ArcGIS geoprocessing stage, rectangles only
+def tempShapefilePipeline(inFC, outFC, spatRef=None, tolerance=1, workspace=None, columns=None): # function to regularize buildings through ArcGIS tools and temp shapefiles
+    loadArcpy()
+    workspace = workspace or os.path.join(os.path.dirname(os.path.abspath(outFC)), 'temp')                              # temp/ next to the output folder, as before
+    if not os.path.isdir(workspace):
+        os.makedirs(workspace)
+    simplifyBuildingsFC, polyLinesFC, splitLinesFC = [os.path.join(workspace, name) for name in outputFiles(['simplifyBuildings', 'polylines', 'splitPolyline'])]
+    spatRef = spatRef or arcpy.Describe(inFC).spatialReference
+
+    addMessage("******** CLOSE ALL FILES EXCEPT INPUT IN ARCMAP BEFORE RUNNING SCRIPT ********")
+
+    columnsPath = columns or os.path.join(workspace, 'splitPolyline.columns')                                           # Angle, Angle_Err and Length of every split segment
+    source = _source_(inFC, tolerance=tolerance)
+
+    if _columns_current_(columnsPath, source):                                                                          # repeat run on an unchanged input: no geoprocessing at all
+        with stage("readColumns") as record:
+            summary = readColumns(columnsPath)
+            record.update(_sizes_(summary))
+    else:
+        with stage("simplifyBuilding"):                                                                                 # Douglas-Peucker through ArcGIS
+            simplifyBuilding(inFC, simplifyBuildingsFC, tolerance)
+
+        with stage("polygonToLine"):
+            polygonToLine(simplifyBuildingsFC, polyLinesFC)
+
+        with stage("polylineToSegments"):
+            polylineToSegments(polyLinesFC, splitLinesFC)
+
+        with stage("geomEdgeSummary") as record:
+            summary = geomEdgeSummary(splitLinesFC)                                                                     # the only scan of the split segments
+            record.update(_sizes_(summary))
+
+        with stage("writeColumns") as record:                                                                           # replaces the AddField and UpdateCursor passes of buildingVertexAngle, buildingVertexError and buildingLengths
+            writeColumns(columnsPath, summary, segmentColumns(summary), SEGMENT_SCOPES, **source)
+            summary = readColumns(columnsPath)
+            record.update(_sizes_(summary))
+
+    with stage("createEmptyShapefile"):
+        createEmptyShapefile(os.path.dirname(outFC), os.path.basename(outFC), spatRef)
+
+    with stage("regularizeCorners") as record:
+        fixedCoord = regularizeCorners(summary['xy'].reshape(-1, 4, 2))
+        record.update(_sizes_(summary))
+
+    with stage("fixedPolygons") as record:
+        fixedPolygons(fixedCoord, outFC)
+        record.update(records=len(fixedCoord), vertices=4 * len(fixedCoord))
+    return fixedCoord
+
+_PIPELINES_ = dict(memory=inMemoryPipeline, parallel=parallelPipeline, stream=streamPipeline, temp=tempShapefilePipeline, scales=multiScalePipeline) # regularize modes
+
+# library entry point: nothing runs at import time, so this can be called many times in one process
+def regularize(inFC, outFC, mode="memory", **options):                                                                  # function to regularize the buildings of one input into one output
+    """Regularize the buildings of inFC and write them to outFC."""
+    if mode not in _PIPELINES_:
+        raise ValueError("unknown mode %r, expected one of %s" % (mode, ", ".join(sorted(_PIPELINES_))))
+    if mode != "temp" and options.get("backend", "native") == "native":                                                 # the other writers go through arcpy, which takes any feature class
+        _output_sink_(outFC)
+    if mode == "temp" or options.get("backend", "native") != "native" or options.get("simplifier", "numpy") != "numpy":
+        loadArcpy().env.overwriteOutput = True
+    if not checkExistence([inFC]):
+        raise IOError("input not found: %s" % inFC)
+    folder = os.path.dirname(os.path.abspath(outFC))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    if (options.get("rejects") or options.get("metrics")) and (mode != "memory" or options.get("cache") is not None):
+        raise ValueError("validation needs the whole input in one buffer: rejects and metrics work with the 'memory' mode and no cache")
+    if options.get("topology") and (mode not in ("memory", "scales") or options.get("cache") is not None):
+        raise ValueError("shared walls need every neighbour in one buffer: topology works with the 'memory' and 'scales' modes and no cache")
+    if mode == "parallel" and options.get("columns") is not None:
+        raise ValueError("the columnar store is written by one process: columns work with every mode but 'parallel'")
+    if mode == "scales" and options.get("columns") is not None:
+        raise ValueError("the columnar store holds one scale: use the 'memory' mode for columns")
+    cachePath, cacheSize = options.pop("cache", None), options.pop("cacheSize", 1 << 30)
+    if cachePath is not None:
+        if mode not in ("memory", "stream"):
+            raise ValueError("the cache works with the 'memory' and 'stream' modes")
+        if options.get("columns") is not None:
+            raise ValueError("cached buildings are not measured again, so the columnar store needs a run without the cache")
+        options['cache'] = openCache(cachePath, cacheSize)
+
+    try:
+        with stage("total", mode=mode):
+            return _PIPELINES_[mode](inFC, outFC, **options)
+    finally:
+        if cachePath is not None:
+            closeCache(options['cache'])
+
+# one TOLERANCE:EPSILON pair of --scales
+def _scale_(text):                                                                                                      # function to parse a scale of the command line
+    try:
+        tolerance, epsilon = text.split(':')
+        return float(tolerance), float(epsilon)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected TOLERANCE:EPSILON, got %r" % text)
+
+# command line entry point: python orthogonality.py input.shp output.shp [options]
+def main(argv=None):                                                                                                    # function to parse the command line, run regularize and report the stages
+    parser = argparse.ArgumentParser(description="Enforce orthogonal corners in building footprints wherever they fall within 90 +/- epsilon degrees.")
+    parser.add_argument("input", help="building polygons, projected (UTM)")
+    parser.add_argument("output", help="regularized buildings: .shp, .geojsonl (GeoJSON Lines in the input projection, not WGS84) or .gpkg (GeoPackage)")
+    parser.add_argument("--mode", default="memory", choices=sorted(_PIPELINES_), help="'memory' reads the input once, 'parallel' uses a process pool, 'stream' keeps one batch in memory, 'temp' keeps the temp shapefiles of every ArcGIS stage, 'scales' writes one output per --scales pair")
+    parser.add_argument("--backend", default="native", choices=["native", "arcpy"], help="'memory' mode: read and write the shapefiles directly or through arcpy cursors")
+    parser.add_argument("--tolerance", type=float, default=1., help="simplification tolerance, metres")
+    parser.add_argument("--epsilon", type=float, default=15., help="corners within 90 +/- epsilon degrees are snapped")
+    parser.add_argument("--scales", type=_scale_, nargs="+", metavar="TOLERANCE:EPSILON", help="'scales' mode: tolerance and epsilon of every output, e.g. 0.5:10 2:15 5:20; each output is named after the output path, e.g. fixed_t0p5_e10.shp")
+    parser.add_argument("--square-tolerance", type=float, default=1e-3, help="corners within 90 +/- this many degrees count as already orthogonal and are written unchanged")
+    parser.add_argument("--keep-unchanged", action="store_true", help="also copy out of tolerance buildings to the output unchanged (orthogonal ones always are)")
+    parser.add_argument("--orientation", default="histogram", choices=["histogram", "circular", "longest"], help="building reference direction")
+    parser.add_argument("--fit", choices=["least_squares", "minimum_area"], help="rebuild four-corner buildings as their fitted rectangle instead of snapping their walls")
+    parser.add_argument("--rejects", help="'memory' mode: shapefile for the buildings that fail validation, with their REASON code")
+    parser.add_argument("--metrics", help="'memory' mode: JSON file for the validation counts and the area change, Hausdorff distance and corner error of the output")
+    parser.add_argument("--topology", action="store_true", help="'memory' mode: keep the shared walls of adjacent buildings coincident")
+    parser.add_argument("--workers", type=int, default=None, help="'parallel' mode: worker processes, all cores by default")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="'parallel' mode: buildings per chunk")
+    parser.add_argument("--batch-size", type=int, default=10000, help="'stream' mode: buildings per batch, peak memory grows with this and not with the dataset")
+    parser.add_argument("--writer-queue", type=int, default=2, help="'stream' and 'scales' modes: batches waiting for the background writer thread, 0 writes in the pipeline thread")
+    parser.add_argument("--cache", help="'memory' and 'stream' modes: cache file, only new or changed buildings are recomputed on later runs")
+    parser.add_argument("--cache-size", type=float, default=1024., help="cache size bound, MB")
+    parser.add_argument("--columns", help="directory for the columnar store of segment angles, angle errors, lengths and building status (not 'parallel' mode)")
+    parser.add_argument("--stage-log", help="append one JSON line per stage record to this file")
+    parser.add_argument("--trace-memory", action="store_true", help="add the allocated memory to stage records, at some cost in speed")
+    parser.add_argument("--quiet", action="store_true", help="no stage messages")
+    args = parser.parse_args(argv)
+    if args.mode != "temp" and args.backend == "native":
+        try:
+            _output_sink_(args.output)
+        except ValueError as error:
+            parser.error(str(error))
+
+    options = dict(tolerance=args.tolerance)
+    if args.mode != "temp":
+        options.update(epsilon=args.epsilon, keepUnchanged=args.keep_unchanged, orientation=args.orientation, fit=args.fit, squareTolerance=args.square_tolerance)
+    if args.mode == "memory":
+        options.update(backend=args.backend)
+    elif args.mode == "parallel":
+        options.update(workers=args.workers, chunkSize=args.chunk_size)
+    elif args.mode == "stream":
+        options.update(batchSize=args.batch_size, writerQueue=args.writer_queue)
+    elif args.mode == "scales":
+        options.update(scales=args.scales, writerQueue=args.writer_queue)
+    if args.cache:
+        options.update(cache=args.cache, cacheSize=int(args.cache_size * 1e6))
+    if args.columns:
+        options.update(columns=args.columns)
+    if args.topology:
+        options.update(topology=True)
+    if args.rejects or args.metrics:
+        options.update(rejects=args.rejects, metrics=args.metrics)
+
+    callbacks = [] if args.quiet else [addStageCallback(messageSink)]
+    if args.stage_log:
+        callbacks.append(addStageCallback(jsonLinesSink(args.stage_log)))
+    if args.trace_memory:
+        traceMemory()
+    try:
+        result = regularize(args.input, args.output, args.mode, **options)
+    except (IOError, OSError, ImportError, ValueError) as error:
+        addMessage("! " + str(error))
+        return 1
+    finally:
+        for callback in callbacks:
+            removeStageCallback(callback)
+        if args.trace_memory:
+            traceMemory(False)
+
+    if args.mode == "memory":
+        classes = np.bincount(result['status'], minlength=3)
+        print("Orthogonal: ", classes[ORTHOGONAL], " Fixable: ", classes[FIXABLE], " Out of tolerance: ", classes[OUT_OF_TOLERANCE])
+        if 'report' in result:
+            print("Rejected: ", result['report']['rejected'], " Hausdorff p95: ", result['report']['hausdorff']['p95'])
+    if args.mode == "scales":
+        for tolerance, epsilon, path, scale in result:
+            classes = np.bincount(scale['status'], minlength=3)
+            print("Tolerance: ", tolerance, " Epsilon: ", epsilon, " Fixable: ", classes[FIXABLE], " Output: ", path)
+        return 0
+    print("Output is here: \t \t \t ", args.output)
+    return 0
 
-X = str(time.time() - start_time)
-print "-"*40
-print "Time of Execution: ", X, "secs"
-print "-"*40
 
-print "\t"
\ No newline at end of file
+#******************** FUNCTION CALL SECTION *******************************
+if __name__ == '__main__':                                                                                              # worker processes import this file without running the script
+    sys.exit(main())